@@ -4,33 +4,49 @@ import json
 import random
 import re
 from fastapi.websockets import WebSocketState
-import httpx
 import jwt
 import os
 from datetime import datetime, timedelta, UTC
 from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
 from matchmacker import MatchMaker
-import redis.asyncio as aioredis
+from backplane import LocalBackplane, RedisBackplane, cancel_tasks
+from registry import ConnectionRegistry
+from tokens import TokenVerifier
+from hcaptcha import HCaptchaVerifier
+from sessions import MemorySessionStore, RedisSessionStore
+from models import Gender, Mode, RoomMembers, room_key, room_name
+from cleanup import LogoutBatcher
+from ratelimit import RateLimiter
+from heartbeat import HeartbeatReaper
+from history import MemoryRoomHistory, RedisRoomHistory
+import codec
+import logs
+import metrics
 import uuid
 import secrets
+import time
+from collections import deque
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logs.get_logger("app")
+
 SECRET_KEY = os.environ.get("SECRET_KEY", "secret123")
 if not SECRET_KEY:
     SECRET_KEY = secrets.token_hex(32)
-    print("⚠️ WARNING: Using a temporary random SECRET_KEY — tokens won't persist across restarts.")
+    logger.warning("using a temporary random SECRET_KEY, tokens won't persist across restarts")
 ALGORITHM = "HS256"
 EXPIRE_MINUTES = int(os.environ.get("EXPIRE_MINUTES", 60))
 USERNAME_ACCEPTED_PATTERN = re.compile(r"^[a-zA-Z0-9_-]+$")
 
-connections = {} # {username: User}
-connections_lock = asyncio.Lock()
-rooms = {} # {room_name: set(usernames)}
+connections = ConnectionRegistry() # {username: User}, verrou par shard de username
+rooms = {} # {room_key(room_name): RoomMembers(usernames)}
+# Tâches lancées sans être attendues : la boucle n'en garde qu'une référence
+# faible, ce set les garde en vie jusqu'à leur fin
+background_tasks = set()
 origins = ["http://localhost:5173", "http://192.168.1.50:5173"]
-temp_data_setup = {}
 match_maker = MatchMaker()
 
 with open('config.json') as f:
@@ -41,44 +57,98 @@ REDIS_PORT = config["redis"]["port"]
 REDIS_DB = config["redis"]["db"]
 REDIS_PASSWORD = config["redis"]["password"]
 REDIS_MATCHMAKER_KEY = config["redis"]["redis_keys"]["matchmaking"]
-redis_client = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD, decode_responses=True)
-BROKEN_CONNECTIONS_KEY = config["redis"]["redis_keys"]["broked_connections"]
+redis_client = metrics.InstrumentedRedis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD, decode_responses=True)
+SESSIONS_KEY = config["redis"]["redis_keys"]["sessions"]
+HISTORY_KEY = config["redis"]["redis_keys"]["history"]
 REDIS_TTL = config["redis"]["ttl"]
+SERVER_KEY = config["redis"]["redis_keys"]["server"]
 ALL_MODES = config["match"]["modes"]
+BACKPLANE = config["server"]["backplane"]
+OWNER_TTL = config["server"]["owner_ttl"]
+SEND_QUEUE_SIZE = config["server"]["send_queue_size"]
+SEND_QUEUE_OVERFLOW = config["server"]["send_queue_overflow"] # "drop_oldest" ou "disconnect"
+MATCH_BATCH_SIZE = config["match"]["batch_size"]
+MATCH_FALLBACK_INTERVAL = config["match"]["fallback_interval"]
+TOKEN_CACHE_SIZE = config["server"]["token_cache_size"]
+TOKEN_REVOCATION_RECHECK = config["server"]["token_revocation_recheck"]
+REVOKED_KEY = config["redis"]["redis_keys"]["revoked"]
+SESSION_BACKEND = config["sessions"]["backend"] # "redis" (partagé entre workers) ou "memory"
+SESSION_SETUP_TTL = config["sessions"]["setup_ttl"]
+SESSION_MAX_SIZE = config["sessions"]["max_size"]
+CLEANUP_INTERVAL = config["server"]["cleanup_interval"]
+CLEANUP_BATCH_SIZE = config["server"]["cleanup_batch_size"]
+MAX_FRAME_SIZE = config["limits"]["max_frame_size"] # caractères (texte) ou octets (msgpack)
+OVERLOAD_POLICY = config["limits"]["overload"] # "reject" ou "disconnect"
+HEARTBEAT_INTERVAL = config["server"]["heartbeat_interval"] # secondes d'inactivité avant un ping
+IDLE_TIMEOUT = config["server"]["idle_timeout"] # secondes sans aucun frame avant déconnexion
+HEARTBEAT_TICK = config["server"]["heartbeat_tick"]
+HISTORY_BACKEND = config["history"]["backend"] # "memory" (un seul noeud), "redis" (partagé) ou "none"
+HISTORY_REPLAY_LIMIT = config["history"]["replay_limit"]
+
+# Frames entrants par connexion (toutes actions) et messages par room, envoyés depuis ce noeud
+user_limiter = RateLimiter(config["limits"]["user_rate"], config["limits"]["user_burst"])
+room_limiter = RateLimiter(config["limits"]["room_rate"], config["limits"]["room_burst"])
+
+# Avec plusieurs workers (backplane redis), les révocations sont partagées via Redis
+token_verifier = TokenVerifier(
+    SECRET_KEY, ALGORITHM, TOKEN_CACHE_SIZE,
+    redis=redis_client if BACKPLANE == "redis" else None,
+    prefix=REVOKED_KEY,
+    recheck=TOKEN_REVOCATION_RECHECK,
+)
+
+# Profils saisis par /setup/* avant /ws, et profils gardés REDIS_TTL minutes
+# après une déconnexion pour la reconnexion
+if SESSION_BACKEND == "redis":
+    sessions = RedisSessionStore(redis_client, SESSIONS_KEY, SESSION_SETUP_TTL)
+else:
+    sessions = MemorySessionStore(SESSION_SETUP_TTL, SESSION_MAX_SIZE)
+
+# Derniers messages de chaque room, rejoués au client qui revient avec le seq du dernier reçu
+if HISTORY_BACKEND == "redis":
+    history = RedisRoomHistory(redis_client, HISTORY_KEY, config["history"]["size"], config["history"]["ttl"])
+elif HISTORY_BACKEND == "memory":
+    history = MemoryRoomHistory(config["history"]["size"], config["history"]["max_rooms"])
+else:
+    history = None
 
 hcaptcha_enabled = config["hcaptcha"]["enabled"]
+hcaptcha_verifier = None
 if hcaptcha_enabled:
     HSECRET = os.environ.get("HSECRET", None)
     if not HSECRET:
         raise ValueError("Missing HSECRET environment variable")
-
-def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-        return username
-    except jwt.ExpiredSignatureError as e:
-        return None
-    except jwt.InvalidTokenError:
-        return None
-
-async def verify_hcaptcha(token: str, secret_key: str) -> bool:
-    url = "https://hcaptcha.com/siteverify"
-    params = {
-        "secret": secret_key,
-        "response": token
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, params=params)
-        result = response.json()
-        return result.get("success", False)
+    hcaptcha_verifier = HCaptchaVerifier(
+        HSECRET,
+        config["hcaptcha"]["verify_url"],
+        timeout=config["hcaptcha"]["timeout"],
+        max_connections=config["hcaptcha"]["max_connections"],
+        cache_ttl=config["hcaptcha"]["cache_ttl"],
+    )
+
+async def verify_token(token: str):
+    # Cache LRU : jwt.decode n'est refait qu'à la première vue d'un token
+    return await token_verifier.check(token)
 
 async def lifespan(app: FastAPI):
+    await match_maker.load_scripts()
+    wakeup_task = asyncio.create_task(match_maker.listen_wakeups())
+    await backplane.start()
+    if hcaptcha_verifier:
+        await hcaptcha_verifier.start()
+    lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+    cleanup_task = asyncio.create_task(logout_batcher.run())
+    reaper_task = asyncio.create_task(reaper.run())
     task = asyncio.create_task(safe_matchmaking_loop())
     yield
     # shutdown code here
+    # Toutes les tâches de fond sont arrêtées (et attendues) avant de fermer
+    # ce qu'elles utilisent : le pubsub du backplane, le client hCaptcha
+    await cancel_tasks([task, wakeup_task, lag_task, reaper_task, cleanup_task])
+    await logout_batcher.flush()
+    await backplane.stop()
+    if hcaptcha_verifier:
+        await hcaptcha_verifier.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -90,84 +160,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Les frames sont sérialisés au plus une fois par protocole puis partagés par tous les destinataires
+def response_frame(content, action: str) -> codec.Frame:
+    return codec.Frame({"action": action, "success": True, "error": "", "content": content})
+
+def error_frame(error: str) -> codec.Frame:
+    return codec.Frame({"action": "error", "success": False, "error": error})
+
+# Connexions sans frame reçu depuis IDLE_TIMEOUT (TCP semi-ouvert...) : une
+# seule tâche pour tout le process, pinge les inactives et déconnecte les mortes
+reaper = HeartbeatReaper(HEARTBEAT_INTERVAL, IDLE_TIMEOUT, HEARTBEAT_TICK, codec.Frame({"action": "ping", "content": None}))
+
+async def deliver_room(room_name: str, frame: codec.Frame):
+    # Livre un frame aux membres de la room connectés à ce process
+    # send_frame ne fait que mettre en file : aucun client lent ne bloque les autres
+    for username in list(rooms.get(room_key(room_name), ())):
+        if username in connections:
+            connections[username].send_frame(frame)
+
+async def deliver_user(username: str, frame: codec.Frame):
+    if username in connections:
+        connections[username].send_frame(frame)
+
+if BACKPLANE == "redis":
+    backplane = RedisBackplane(redis_client, SERVER_KEY, OWNER_TTL, deliver_room, deliver_user)
+else:
+    backplane = LocalBackplane(deliver_room, deliver_user)
+
+logout_batcher = LogoutBatcher(redis_client, match_maker, sessions, backplane, ALL_MODES, REDIS_TTL * 60,
+                               interval=CLEANUP_INTERVAL, max_batch=CLEANUP_BATCH_SIZE)
+
+async def collect_queue_depths():
+    return {(mode,): depth for mode, depth in (await match_maker.queue_depths()).items()}
+
+def collect_send_queue_depth():
+    return sum(len(user.outbox) for user in connections.values() if user.outbox)
+
+metrics.Gauge("wisp_queue_depth", "Players waiting in the matchmaking queue", ("mode",), collect=collect_queue_depths)
+metrics.Gauge("wisp_active_connections", "WebSocket connections held by this process", collect=lambda: len(connections))
+metrics.Gauge("wisp_rooms", "Rooms with at least one member on this process", collect=lambda: len(rooms))
+metrics.Gauge("wisp_send_queue_depth", "Frames waiting in the per-connection send queues", collect=collect_send_queue_depth)
+
+async def is_user_online(username: str) -> bool:
+    user = connections.get(username)
+    if user is not None:
+        return user.active
+    # Peut-être connecté à un autre noeud
+    return await backplane.is_online(username)
+
+async def handle_match(mode: str, player1info: dict, player2info: dict):
+    player1, player2 = player1info["username"], player2info["username"]
+
+    player1_still_connected, player2_still_connected = await asyncio.gather(is_user_online(player1), is_user_online(player2))
+    if not player1_still_connected or not player2_still_connected:
+        # Le survivant reprend sa place dans la file, avec son ancienneté
+        if player1_still_connected:
+            await match_maker.add_player(player1, player1info["gender"], player1info["age"], player1info["interests"], mode, join_time=player1info.get("join_time"))
+        if player2_still_connected:
+            await match_maker.add_player(player2, player2info["gender"], player2info["age"], player2info["interests"], mode, join_time=player2info.get("join_time"))
+        return
+
+    # Comptées seulement une fois les deux joueurs confirmés en ligne
+    now = time.time()
+    metrics.MATCHES.inc(mode)
+    for player in (player1info, player2info):
+        metrics.TIME_TO_MATCH.observe(now - player.get("join_time", now), mode)
+
+    room_id = str(uuid.uuid4())
+    logger.info("match found", event="match", mode=mode, player1=player1, player2=player2, room=room_id)
+
+    await asyncio.gather(
+        backplane.send_to_user(player1, response_frame({"room": room_id, "user": {"username": player2, "gender": player2info["gender"]}}, "matched")),
+        backplane.send_to_user(player2, response_frame({"room": room_id, "user": {"username": player1, "gender": player1info["gender"]}}, "matched")),
+    )
+
 async def matchmaking_loop():
     global match_maker, connections
-    modes = ["chill", "date"]
+    modes = list(match_maker.keys)
     while True:
+        # Réveillé par add_player (ici ou dans un autre process) ; le timer de
+        # secours rattrape un éventuel message pub/sub perdu.
+        await match_maker.wait_for_players(MATCH_FALLBACK_INTERVAL)
         for mode in modes:
-            match = await match_maker.find_match(mode)
-            if match:
-                player1info, player2info = match
-                player1, player2 = player1info["username"], player2info["username"]
-                
-                async with connections_lock:
-                    try:
-                        user1 = connections[player1]
-                        user2 = connections[player2]
-                    except KeyError:
-                        player1_still_connected = player1 in connections
-                        player2_still_connected = player2 in connections
-                        if player1_still_connected and not player2_still_connected:
-                            await match_maker.add_player(player1, player1info["gender"], player1info["age"], player1info["interests"], mode)
-                        
-                        if player2_still_connected and not player1_still_connected:
-                            await match_maker.add_player(player2, player2info["gender"], player2info["age"], player2info["interests"], mode)
-                        
-                        await asyncio.sleep(0.1)
-                        continue
-
-                    if not user1.active or not user2.active:
-                        if user1.active:
-                            await match_maker.add_player(player1, player1info["gender"], player1info["age"], player1info["interests"], mode)
-                        if user2.active:
-                            await match_maker.add_player(player2, player2info["gender"], player2info["age"], player2info["interests"], mode)
-                        await asyncio.sleep(0.1)
-                        continue
-
-                    print(f"Match found: {player1} vs {player2}")
-                    room_id = str(uuid.uuid4())
-                                    
-                await user1.send_response({"room": room_id, "user": {"username": player2, "gender": player2info["gender"]}}, "matched")
-                await user2.send_response({"room": room_id, "user": {"username": player1, "gender": player1info["gender"]}}, "matched")
-                await asyncio.sleep(0.2)
-        await asyncio.sleep(0.1) # Empêche la boucle de tourner à vide trop vite
+            matches = await match_maker.find_matches(mode, MATCH_BATCH_SIZE)
+            if matches:
+                # Toutes les paires du tick sont notifiées en parallèle
+                await asyncio.gather(*(handle_match(mode, player1info, player2info) for player1info, player2info in matches))
+            if len(matches) >= MATCH_BATCH_SIZE:
+                # Lot plein : il reste sûrement des joueurs, on repasse tout de suite
+                match_maker.wakeup.set()
 
 async def safe_matchmaking_loop():
     while True:
         try:
-            print("Starting matchmaking loop")
+            logger.info("starting matchmaking loop")
             await matchmaking_loop()
-        except Exception as e:
-            print(f"[ERROR] matchmaking loop crashed: {e}")
+        except Exception:
+            logger.exception("matchmaking loop crashed")
             await asyncio.sleep(1)
 
-async def get_broken_users():
-    cursor = 0
-    broken_users = []
-    while True:
-        cursor, users = await redis_client.scan(cursor=cursor, match=f"{BROKEN_CONNECTIONS_KEY}:*", count=100)
-        if users:
-            broken_users.extend(users)
-        if cursor == 0:
-            break
-    return [k.split(":", 1)[1] for k in broken_users]
-
 @app.get("/")
 async def read_root():
     return "I work!"
 
 @app.get("/token")
 async def get_token(username: str, request: Request):
-    async with connections_lock:
-        users = connections.keys()
-    
     if not USERNAME_ACCEPTED_PATTERN.match(username):
         return Response(
             status_code=400,
             content="Invalid username format"
         )
     
-    if username in users:
+    if username in connections or await backplane.is_online(username):
         return Response(status_code=409, content=f"Username {username} already taken")
     
     if hcaptcha_enabled:
@@ -175,13 +279,14 @@ async def get_token(username: str, request: Request):
         if not hcaptcha_token:
             return Response(status_code=401, content="Invalid token")
         
-        valid = await verify_hcaptcha(hcaptcha_token, HSECRET)
+        valid = await hcaptcha_verifier.verify(hcaptcha_token)
         if not valid:
             return Response(status_code=401, content="Invalid token")
             
     expire = datetime.now(UTC) + timedelta(minutes=EXPIRE_MINUTES)
     username = username[:20]
-    payload = {"sub": username, "exp": expire}
+    # jti : deux tokens émis la même seconde restent distincts (révocation)
+    payload = {"sub": username, "exp": expire, "jti": secrets.token_hex(8)}
     token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
     
     return {"token": token}
@@ -191,14 +296,15 @@ async def get_username_exist(username: str):
     if not USERNAME_ACCEPTED_PATTERN.match(username):
         raise HTTPException(status_code=400, detail="Invalid username format")
     
-    async with connections_lock:
-        exist = username in connections
+    exist = username in connections
+    if not exist:
+        exist = await backplane.is_online(username)
             
     return {"exist": exist}
 
 @app.get("/token/validate")
 async def validate_token(token: str):
-    username = verify_token(token)
+    username = await verify_token(token)
     if username:
         return Response(status_code=200, content=username)
     else:
@@ -206,8 +312,9 @@ async def validate_token(token: str):
 
 @app.get("/token/logout")
 async def logout(token: str):
-    username = verify_token(token)
+    username = await verify_token(token)
     if username:
+        await token_verifier.revoke(token)
         if username in connections:
             await connections[username].logout()
         return Response(status_code=200, content="Logged out")
@@ -220,7 +327,7 @@ async def join_matchmaking(request: Request):
     if not token:
         return Response(status_code=401, content="Invalid token")
     
-    username = verify_token(token)
+    username = await verify_token(token)
     if not username:
         return Response(status_code=401, content="Invalid token")
     
@@ -231,11 +338,8 @@ async def join_matchmaking(request: Request):
     if not user.active or not user.GENDER or not user.AGE or not user.INTERESTS or not user.mode:
         return Response(status_code=403, content="User setup is not complete")
         
-    for mode_to_remove in ALL_MODES:
-        if mode_to_remove != user.mode:
-            await match_maker.remove_player(username, mode_to_remove, ignore_error=True)
-            
-    await match_maker.add_player(username, user.GENDER, user.AGE, user.INTERESTS, user.mode)
+    # Retrait des autres files et ajout dans une seule transaction
+    await match_maker.add_player(username, user.GENDER, user.AGE, user.INTERESTS, user.mode, remove_from=ALL_MODES)
     return Response(status_code=200, content="Joined matchmaking")
 
 @app.post("/setup/info")
@@ -243,7 +347,7 @@ async def setup_info(request: Request):
     token = request.headers.get("Authorization", None)
     if not token:
         return Response(status_code=401, content="Invalid token")
-    username = verify_token(token)
+    username = await verify_token(token)
     if not username:
         return Response(status_code=401, content="Invalid token")
                 
@@ -255,28 +359,26 @@ async def setup_info(request: Request):
     if not age or not gender or not isinstance(age, int) or age < 18 or gender not in ["male", "female"] or not interests:
         return Response(status_code=400, content="Missing or invalid fields")
         
-    temp_data_setup[username] = {"age": age, "gender": gender, "interests": interests, "datetime": datetime.now()}
+    await sessions.set(username, {"age": age, "gender": gender, "interests": interests})
     return Response(status_code=200, content="Setup info received")
 
 @app.post("/setup/mode")
 async def setup_mode(request: Request):
     token = request.headers.get("Authorization", None)
-    username = verify_token(token)
+    username = await verify_token(token)
     if not username:
         return Response(status_code=401, content="Invalid token")
         
     data = await request.json()
     mode = data.get("mode", None)
-    print(mode)
     if not mode or mode not in ["chill", "date", "interests"]:
         return Response(status_code=400, content="Missing or invalid mode")
         
     if username in connections:
-        connections[username].mode = mode.lower()
-        print(connections[username].mode)
+        connections[username].mode = Mode(mode.lower())
+        logger.debug("mode updated", user=username, mode=mode.lower())
         return Response(status_code=200, content="Mode updated")
-    elif username in temp_data_setup:
-        temp_data_setup[username]["mode"] = mode.lower()
+    elif await sessions.update(username, mode=mode.lower()):
         return Response(status_code=200, content="Mode updated")
     else:
         return Response(status_code=403, content="Need login first")
@@ -284,13 +386,15 @@ async def setup_mode(request: Request):
 @app.get("/matchmaking/stats/people")
 async def people_live(request: Request):
     token = request.headers.get("Authorization", None)
-    username = verify_token(token)
+    username = await verify_token(token)
     if not username:
         return Response(status_code=401, content="Invalid token")
         
-    # Cette partie semble incomplète, je la laisse telle quelle
-    for mode in match_maker.keys:
-        len(await redis_client.hkeys(mode))
+    return await match_maker.queue_depths()
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=await metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
@@ -299,48 +403,86 @@ async def ws_endpoint(ws: WebSocket):
         await ws.close(code=4401, reason="Token missing")
         return
 
-    username = verify_token(token)
+    username = await verify_token(token)
     if not username:
         await ws.close(code=4401, reason="Invalid token")
         return
-        
-    await ws.accept()
+
+    # Protocole binaire MessagePack en option (sous-protocole ou ?proto=msgpack)
+    binary = codec.msgpack_available() and (
+        codec.MSGPACK_SUBPROTOCOL in ws.scope.get("subprotocols", []) or ws.query_params.get("proto") == "msgpack"
+    )
+    if binary and codec.MSGPACK_SUBPROTOCOL in ws.scope.get("subprotocols", []):
+        await ws.accept(subprotocol=codec.MSGPACK_SUBPROTOCOL)
+    else:
+        await ws.accept()
     
     user = None
     try:
-        async with connections_lock:
+        # Profil (setup ou état de reconnexion) lu hors du verrou, seulement si nécessaire.
+        # Il n'est supprimé qu'une fois l'utilisateur dans connections : /setup/mode
+        # le trouve toujours à l'un des deux endroits.
+        data = None
+        if username not in connections:
+            # Déconnecté il y a un instant : le profil n'est pas encore parti dans Redis
+            data = await logout_batcher.reclaim(username) or await sessions.get(username)
+
+        old_ws = None
+        setup_missing = False
+        created = False
+        async with connections.lock(username):
             if username in connections:
                 old_user = connections[username]
-                # Fermer l'ancienne connexion si elle est toujours active
-                if old_user.ws and old_user.ws.client_state != WebSocketState.DISCONNECTED:
-                    try:
-                        await old_user.ws.close(code=1000, reason="New connection established")
-                    except Exception:
-                        pass # Ignorer les erreurs si la socket est déjà fermée
+                old_ws = old_user.ws
                 old_user.ws = ws
+                old_user.binary = binary
                 old_user.active = True
+                old_user.last_seen = time.monotonic()
                 user = old_user
-                print(f"✅ User {username} reconnected - WebSocket updated")
+                logger.info("user reconnected", event="connect", user=username, reconnect=True)
+            elif data is None:
+                setup_missing = True # fermé hors du verrou : pas d'I/O réseau sous le verrou
             else:
-                broken_users = await get_broken_users()
-                if username in temp_data_setup:
-                    data = temp_data_setup[username]
-                elif username in broken_users:
-                    data = json.loads(await redis_client.get(f"{BROKEN_CONNECTIONS_KEY}:{username}"))
-                    await redis_client.delete(f"{BROKEN_CONNECTIONS_KEY}:{username}")
-                else:
-                    await ws.close(code=1008, reason="Setup info missing")
-                    return
-                
-                user = User(ws, username, data)
-                connections[username] = user
-                print(f"✅ User {username} connected for the first time.")
+                user = User(ws, username, data, binary=binary)
+                connections.add(username, user)
+                created = True
+                reaper.watch(user)
+                logger.info("user connected", event="connect", user=username, reconnect=False)
+
+        if setup_missing:
+            await ws.close(code=1008, reason="Setup info missing")
+            return
+
+        if created:
+            # Un changement de mode arrivé entre la lecture et l'enregistrement est repris
+            latest = await sessions.pop(username)
+            if latest and latest.get("mode") and latest.get("mode") != data.get("mode"):
+                user.mode = Mode(latest["mode"])
+
+        # Fermer l'ancienne connexion (hors verrou) si elle est toujours active
+        if old_ws and old_ws.client_state != WebSocketState.DISCONNECTED:
+            try:
+                await old_ws.close(code=1000, reason="New connection established")
+            except Exception:
+                pass # Ignorer les erreurs si la socket est déjà fermée
+
+        await backplane.register_user(username)
 
         # Boucle de réception des messages
         while True:
-            data = await ws.receive_text()
             try:
-                content = json.loads(data)
+                data = await (ws.receive_bytes() if binary else ws.receive_text())
+                user.last_seen = time.monotonic()
+                # Limites testées avant tout décodage : un frame rejeté ne coûte presque rien
+                if len(data) > MAX_FRAME_SIZE:
+                    if await user.overload("too_large", "Frame too large", code=1009):
+                        break
+                    continue
+                if not user_limiter.allow(user.bucket):
+                    if await user.overload("rate_limited", "Rate limit exceeded"):
+                        break
+                    continue
+                content = codec.unpack_request(data) if binary else codec.loads(data)
                 action = content.get("action")
                 
                 if action == "join":
@@ -349,153 +491,228 @@ async def ws_endpoint(ws: WebSocket):
                     await user.leave_room(content)
                 elif action == "send":
                     await user.send_message(content)
+                # "pong" (réponse au ping) : rien d'autre à faire que last_seen
                             
-            except json.JSONDecodeError:
-                print("Message reçu invalide :", data)
+            except codec.DecodeError:
+                logger.warning("invalid frame", event="invalid_frame", user=username, data=data[:200])
     
     except WebSocketDisconnect:
-        print(f"[{username}] WebSocket disconnected (state: {ws.client_state})")
-    except Exception as e:
-        print(f"[{username}] Error in websocket loop: {e}")
+        logger.info("websocket disconnected", event="disconnect", user=username)
+    except Exception:
+        logger.exception("error in websocket loop", user=username)
     finally:
         # ---- MODIFICATION IMPORTANTE ----
         # Ne déconnecter l'utilisateur que si sa connexion actuelle est bien
         # celle qui vient de se fermer. S'il s'est déjà reconnecté, user.ws
         # pointera vers la NOUVELLE websocket, et non plus vers 'ws'.
         if user and user.ws is ws:
-            print(f"[{username}] Cleaning up connection as it's the last active one.")
             await user.logout()
         else:
             # Si 'user.ws' est différent de 'ws', cela signifie qu'une nouvelle
             # connexion a déjà pris le relais. L'ancienne instance se termine
             # sans rien faire pour ne pas déconnecter l'utilisateur actif.
-            print(f"[{username}] Old connection instance for a reconnected user is closing. No cleanup needed.")
+            logger.debug("replaced connection closed, no cleanup needed", user=username)
 
 
 class User():
-    def __init__(self, ws: WebSocket, username: str, setup_info: dict):
+    # Des dizaines de milliers d'instances par process : pas de __dict__
+    __slots__ = ("username", "my_rooms", "ws", "binary", "active", "_logout_called", "outbox", "_writer",
+                 "bucket", "last_seen", "GENDER", "AGE", "INTERESTS", "mode")
+
+    def __init__(self, ws: WebSocket, username: str, setup_info: dict, binary: bool = False):
         self.username = username
-        self.my_rooms = []
+        self.my_rooms = set() # clés des rooms, partagées avec le dict rooms
         self.ws = ws
+        self.binary = binary
         self.active = True
         self._logout_called = False
+
+        # File d'envoi bornée vidée par une tâche dédiée : un broadcast ne fait
+        # jamais attendre l'émetteur sur la socket d'un autre utilisateur. File
+        # et tâche n'existent que tant qu'il reste des frames à écrire : une
+        # connexion inactive ne les paie pas (plusieurs Ko par utilisateur).
+        self.outbox = None
+        self._writer = None
+        self.bucket = user_limiter.bucket()
+        self.last_seen = time.monotonic() # dernier frame reçu, lu par le reaper
                 
-        self.GENDER = setup_info["gender"]
+        self.GENDER = Gender(setup_info["gender"])
         self.AGE = setup_info["age"]
-        self.INTERESTS = setup_info["interests"]
-        self.mode = setup_info.get("mode", "date")
-                
-        if username in temp_data_setup:
-            temp_data_setup.pop(username)
+        self.INTERESTS = tuple(setup_info["interests"])
+        self.mode = Mode(setup_info.get("mode", "date"))
         
     async def logout(self):
         if self._logout_called:
             return
         self._logout_called = True
                 
-        print(f"[{self.username}] Logging out...")
+        logger.info("logging out", event="logout", user=self.username)
         self.active = False
                 
-        async with connections_lock:
-            if self.username in connections:
-                # Sauvegarder l'état dans Redis pour une future reconnexion
-                await redis_client.set(f"{BROKEN_CONNECTIONS_KEY}:{self.username}", json.dumps({
-                    "gender": self.GENDER,
-                    "age": self.AGE,
-                    "interests": self.INTERESTS,
-                    "mode": self.mode
-                }), ex=REDIS_TTL * 60)
-                
-                # Retirer des connexions actives
-                connections.pop(self.username)
-
-        # Retirer du matchmaking
-        for mode in ALL_MODES:
-            await match_maker.remove_player(self.username, mode, ignore_error=True)
+        # Retirer des connexions actives
+        async with connections.lock(self.username):
+            removed = connections.discard(self.username, self)
+
+        # Sauvegarde du profil pour une future reconnexion, retrait du
+        # matchmaking et libération du username : regroupés par logout_batcher
+        profile = None
+        if removed:
+            profile = {
+                "gender": self.GENDER,
+                "age": self.AGE,
+                "interests": self.INTERESTS,
+                "mode": self.mode
+            }
+        await backplane.unregister_user(self.username, release=False)
+        logout_batcher.add(self.username, profile)
                 
         # Nettoyer les rooms
-        for room in list(self.my_rooms):
-            await self.leave_room({"room": room}, verbose=False)
+        for key in list(self.my_rooms):
+            await self.leave_room({"room": room_name(key)}, verbose=False)
                 
         # Fermer la WS si elle est encore ouverte
         try:
             if self.ws.client_state == WebSocketState.CONNECTED:
                 await self.ws.close(code=1000, reason="User logged out")
         except Exception as e:
-            print(f"[{self.username}] Error closing websocket during logout: {e}")
+            logger.warning("error closing websocket during logout", user=self.username, error=str(e))
+
+        if self._writer:
+            self._writer.cancel()
 
     async def join_room(self, content: dict):
         room_name = content["room"]
-        rooms.setdefault(room_name, set()).add(self.username)
-        if room_name not in self.my_rooms:
-            self.my_rooms.append(room_name)
+        key = room_key(room_name)
+        members = rooms.get(key)
+        if members is None:
+            members = rooms[key] = RoomMembers(key, room_limiter.bucket())
+            await backplane.subscribe_room(room_name)
+        members.add(self.username)
+        self.my_rooms.add(members.key)
         await self.send_response(f"Joined room {room_name}", "join")
 
+        # Rattrapage après une coupure : tous les messages manqués en un seul frame
+        since = content.get("since")
+        if since is not None and history:
+            try:
+                missed = await history.since(room_name, since, HISTORY_REPLAY_LIMIT)
+            except ValueError as e:
+                await self.send_error(str(e))
+                return
+            await self.send_response({"room": room_name, "messages": missed}, "history")
+
     async def leave_room(self, content, verbose: bool = True):
         room_name = content["room"]
-        if room_name in self.my_rooms:
-            self.my_rooms.remove(room_name)
-            if room_name in rooms:
-                rooms[room_name].discard(self.username)
+        key = room_key(room_name)
+        if key in self.my_rooms:
+            self.my_rooms.discard(key)
+            members = rooms.get(key)
+            if members is not None:
+                members.discard(self.username)
                 if verbose:
-                    print(f"[{self.username}] Left room", room_name)
+                    logger.info("left room", event="leave_room", user=self.username, room=room_name)
                     await self.send_response(f"Left room {room_name}", "leave_room")
-                
-                remaining_users = rooms.get(room_name)
-                if remaining_users and len(remaining_users) == 0:
-                    rooms.pop(room_name)
-                    return
-                
-                if remaining_users:
-                    for username in list(remaining_users):
-                        if username in connections:
-                            await connections[username].send_response(self.username, "user_left")
+
+                # Prévenir les membres restants, y compris ceux des autres noeuds
+                await backplane.publish_room(room_name, response_frame(self.username, "user_left"))
+
+                if not rooms.get(key):
+                    rooms.pop(key, None)
+                    await backplane.unsubscribe_room(room_name)
+                    if history:
+                        # Plus personne ici pour la rattraper : son buffer ne reste pas en mémoire
+                        await history.forget(room_name)
 
     async def send_message(self, content: dict):
         room_name = content["room"]
         message = content["message"]
-        if room_name not in rooms:
+        key = room_key(room_name)
+        members = rooms.get(key)
+        if members is None:
             await self.send_error(f"Room {room_name} does not exist")
             return
                 
-        if room_name not in self.my_rooms or self.username not in rooms[room_name]:
+        if key not in self.my_rooms or self.username not in members:
             await self.send_error("You are not in this room")
             return
+        if not room_limiter.allow(members.bucket):
+            metrics.FRAMES_REJECTED.inc("room_rate_limited")
+            await self.send_error("Room rate limit exceeded")
+            return
         await self.broadcast_room(room_name, message)
 
     async def broadcast_room(self, room_name: str, content: str):
-        if room_name not in rooms:
-            return
-        for username in list(rooms[room_name]):
-            if username in connections:
-                await connections[username].relay_message(self.username, room_name, content)
-
-    async def send_response(self, content, action: str):
-        if not self.active:
+        if room_key(room_name) not in rooms:
             return
+        message = {"message": content, "from_user": self.username, "from_room": room_name}
+        if history:
+            message["seq"] = await history.append(room_name, content, self.username)
+        frame = codec.Frame({"action": "receive_message", "content": message})
+        await backplane.publish_room(room_name, frame)
+        metrics.MESSAGES_RELAYED.inc()
+        logger.debug("message relayed", event="message", user=self.username, room=room_name)
+
+    async def _write_loop(self):
+        outbox = self.outbox
         try:
-            if self.ws.client_state == WebSocketState.CONNECTED:
-                await self.ws.send_json({"action": action, "success": True, "error": "", "content": content})
-        except Exception as e:
-            print(f"[{self.username}] Error sending response: {e}")
-
-    async def send_error(self, error: str):
-        if not self.active:
-            return
+            while outbox:
+                frame = outbox.popleft()
+                await self._write(frame)
+        finally:
+            # Aucun await entre le dernier test de la file et ici : un frame
+            # ajouté ensuite par send_frame relancera une nouvelle tâche
+            self.outbox = None
+            self._writer = None
+
+    async def _write(self, frame: codec.Frame):
         try:
-            if self.ws.client_state == WebSocketState.CONNECTED:
-                await self.ws.send_json({"action": "error", "success": False, "error": error})
+            # self.ws est relu à chaque frame : il change lors d'une reconnexion
+            if self.active and self.ws.client_state == WebSocketState.CONNECTED:
+                if self.binary:
+                    await self.ws.send_bytes(frame.packed)
+                else:
+                    await self.ws.send_text(frame.text)
         except Exception as e:
-            print(f"[{self.username}] Error sending error: {e}")
+            logger.warning("error sending frame", user=self.username, error=str(e))
 
-    async def relay_message(self, from_user, from_room, content):
+    def send_frame(self, frame: codec.Frame):
         if not self.active:
             return
-        try:
-            if self.ws.client_state == WebSocketState.CONNECTED:
-                await self.ws.send_json({"action": "receive_message", "content": {"message": content, "from_user": from_user, "from_room": from_room}})
-        except Exception as e:
-            print(f"[{self.username}] Error relaying message: {e}")
+        outbox = self.outbox
+        if outbox is None:
+            outbox = self.outbox = deque()
+        if len(outbox) >= SEND_QUEUE_SIZE:
+            if SEND_QUEUE_OVERFLOW == "disconnect":
+                logger.warning("send queue full, disconnecting slow consumer", event="slow_consumer", user=self.username)
+                self.active = False # plus rien ne rentre dans la file d'ici la déconnexion
+                task = asyncio.create_task(self.logout())
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+                return
+            # drop_oldest : le client lent perd ses frames les plus anciens
+            outbox.popleft()
+        outbox.append(frame)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def send_response(self, content, action: str):
+        self.send_frame(response_frame(content, action))
+
+    async def send_error(self, error: str):
+        self.send_frame(error_frame(error))
+
+    async def overload(self, reason: str, error: str, code: int = 1008) -> bool:
+        """Frame refusé par les limites. Retourne True si la connexion est fermée."""
+        metrics.FRAMES_REJECTED.inc(reason)
+        if OVERLOAD_POLICY == "disconnect":
+            logger.warning("closing overloading client", event="overload", user=self.username, reason=reason)
+            await self.ws.close(code=code, reason=error)
+            return True
+        self.send_frame(error_frame(error))
+        # Les frames en attente d'un client qui inonde sont lus sans suspension :
+        # on rend la main à la boucle à chaque rejet
+        await asyncio.sleep(0)
+        return False
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable
+from codec import Frame
+import logs
+
+logger = logs.get_logger("backplane")
+
+Deliver = Callable[[str, Frame], Awaitable[None]]
+
+# Ne supprime la propriété d'un username que si elle appartient encore à ce noeud
+RELEASE_OWNER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+async def cancel_tasks(tasks):
+    """
+    Annule les tâches et attend leur fin. Le client Redis peut avaler une
+    annulation reçue pendant une commande (la commande aboutit, la tâche
+    continue) : les tâches encore vivantes sont réannulées jusqu'à leur fin.
+    """
+    pending = set(tasks)
+    while pending:
+        for task in pending:
+            task.cancel()
+        _, pending = await asyncio.wait(pending, timeout=0.1)
+
+class LocalBackplane():
+    """Backplane mono-process : les rooms et les utilisateurs sont tous locaux."""
+
+    def __init__(self, deliver_room: Deliver, deliver_user: Deliver):
+        self.deliver_room = deliver_room
+        self.deliver_user = deliver_user
+        self.node_id = uuid.uuid4().hex
+        self.local_users = set()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def register_user(self, username: str):
+        self.local_users.add(username)
+
+    async def unregister_user(self, username: str, release: bool = True):
+        self.local_users.discard(username)
+
+    async def load_scripts(self):
+        pass
+
+    async def queue_release(self, pipe, username: str):
+        """Ajoute au pipeline la libération des ressources partagées de username."""
+        pass
+
+    async def is_online(self, username: str) -> bool:
+        return username in self.local_users
+
+    async def subscribe_room(self, room_name: str):
+        pass
+
+    async def unsubscribe_room(self, room_name: str):
+        pass
+
+    async def publish_room(self, room_name: str, frame: Frame):
+        await self.deliver_room(room_name, frame)
+
+    async def send_to_user(self, username: str, frame: Frame) -> bool:
+        if username not in self.local_users:
+            return False
+        await self.deliver_user(username, frame)
+        return True
+
+
+class RedisBackplane(LocalBackplane):
+    """
+    Backplane multi-process : chaque room a un canal pub/sub, chaque noeud un
+    canal direct. Le noeud qui détient la WebSocket d'un username est enregistré
+    dans Redis avec un TTL rafraîchi périodiquement.
+    """
+
+    def __init__(self, redis, prefix: str, owner_ttl: int, deliver_room: Deliver, deliver_user: Deliver):
+        super().__init__(deliver_room, deliver_user)
+        self.redis = redis
+        self.prefix = prefix
+        self.owner_ttl = owner_ttl
+        self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        self._release_owner = redis.register_script(RELEASE_OWNER_SCRIPT)
+        self._tasks = []
+
+    def owner_key(self, username: str):
+        return f"{self.prefix}:owner:{username}"
+
+    def room_channel(self, room_name: str):
+        return f"{self.prefix}:room:{room_name}"
+
+    def node_channel(self, node_id: str):
+        return f"{self.prefix}:node:{node_id}"
+
+    async def load_scripts(self):
+        # Préchargé : queue_release peut alors envoyer un EVALSHA brut
+        await self.redis.script_load(RELEASE_OWNER_SCRIPT)
+
+    async def start(self):
+        await self.load_scripts()
+        await self.pubsub.subscribe(self.node_channel(self.node_id))
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._refresh_owners()),
+        ]
+
+    async def stop(self):
+        # Listener et rafraîchissement arrêtés avant de fermer le pubsub
+        await cancel_tasks(self._tasks)
+        for username in list(self.local_users):
+            await self.unregister_user(username)
+        await self.pubsub.aclose()
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    kind, node, target, text = self.unpack(message["data"])
+                    # Les frames émis par ce noeud ont déjà été livrés en local
+                    if node == self.node_id and kind == "room":
+                        continue
+                    # Un seul Frame par message reçu : son encodage est partagé en local
+                    if kind == "room":
+                        await self.deliver_room(target, Frame(text=text))
+                    elif kind == "user":
+                        await self.deliver_user(target, Frame(text=text))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("backplane listener crashed")
+                await asyncio.sleep(1)
+
+    @staticmethod
+    def pack(kind: str, node: str, target: str, frame: Frame) -> str:
+        # En-tête JSON sur une ligne puis le frame JSON brut : pas de double encodage
+        return json.dumps([kind, node, target]) + "\n" + frame.text
+
+    @staticmethod
+    def unpack(data: str):
+        header, frame = data.split("\n", 1)
+        kind, node, target = json.loads(header)
+        return kind, node, target, frame
+
+    async def _refresh_owners(self):
+        while True:
+            await asyncio.sleep(self.owner_ttl / 3)
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for username in list(self.local_users):
+                        pipe.set(self.owner_key(username), self.node_id, ex=self.owner_ttl)
+                    await pipe.execute()
+            except Exception:
+                logger.exception("backplane owner refresh failed")
+
+    async def register_user(self, username: str):
+        await super().register_user(username)
+        await self.redis.set(self.owner_key(username), self.node_id, ex=self.owner_ttl)
+
+    async def unregister_user(self, username: str, release: bool = True):
+        # release=False : la propriété sera libérée plus tard par queue_release
+        await super().unregister_user(username)
+        if release:
+            await self._release_owner(keys=[self.owner_key(username)], args=[self.node_id])
+
+    async def queue_release(self, pipe, username: str):
+        pipe.evalsha(self._release_owner.sha, 1, self.owner_key(username), self.node_id)
+
+    async def is_online(self, username: str) -> bool:
+        if username in self.local_users:
+            return True
+        return bool(await self.redis.exists(self.owner_key(username)))
+
+    async def subscribe_room(self, room_name: str):
+        await self.pubsub.subscribe(self.room_channel(room_name))
+
+    async def unsubscribe_room(self, room_name: str):
+        await self.pubsub.unsubscribe(self.room_channel(room_name))
+
+    async def publish_room(self, room_name: str, frame: Frame):
+        await self.deliver_room(room_name, frame)
+        await self.redis.publish(self.room_channel(room_name), self.pack("room", self.node_id, room_name, frame))
+
+    async def send_to_user(self, username: str, frame: Frame) -> bool:
+        if username in self.local_users:
+            await self.deliver_user(username, frame)
+            return True
+        owner = await self.redis.get(self.owner_key(username))
+        if not owner:
+            return False
+        await self.redis.publish(self.node_channel(owner), self.pack("user", self.node_id, username, frame))
+        return True
@@ -0,0 +1,25 @@
+"""
+Outils partagés par les benchmarks.
+
+À importer avant tout module du backend : l'import rend ces modules
+importables et se place dans backend/, d'où ils lisent config.json.
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+
+def argument_parser(doc: str) -> argparse.ArgumentParser:
+    # La docstring du benchmark sert d'aide, mise en page conservée
+    return argparse.ArgumentParser(description=doc, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+
+def percentile(values: list, p: float):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
@@ -0,0 +1,131 @@
+"""
+Mémoire par utilisateur connecté, à 10k et 100k connexions simulées.
+
+Crée N User d'app.py inactifs (deux par room créée par le matchmaking, comme
+après un match) et mesure avec tracemalloc les octets alloués par
+utilisateur : objet User, profil, file d'envoi et tâche d'écriture, entrée du
+registre et appartenance aux rooms. Le même scénario est rejoué avec une réplique de
+l'ancien modèle (__dict__, my_rooms en liste, UUID en str, genre et mode en
+str issues du JSON) pour comparaison.
+
+La WebSocket et le transport ASGI ne sont pas comptés : une seule fausse
+socket est partagée par tous les utilisateurs.
+
+Usage (depuis backend/) : python benchmarks/connection_memory.py [--users 10000 100000]
+"""
+import asyncio
+import gc
+import json
+import tracemalloc
+import uuid
+
+import common
+import app
+from models import RoomMembers, room_key
+from registry import ConnectionRegistry
+
+
+class FakeWebSocket():
+    client_state = None
+
+
+class LegacyUser():
+    """Disposition mémoire du User d'avant les __slots__ : __dict__, file et
+    tâche d'écriture permanentes."""
+
+    def __init__(self, ws, username: str, setup_info: dict):
+        self.username = username
+        self.my_rooms = []
+        self.ws = ws
+        self.binary = False
+        self.active = True
+        self._logout_called = False
+        self.outbox = asyncio.Queue(maxsize=app.SEND_QUEUE_SIZE)
+        self._writer = asyncio.create_task(self._write_loop())
+        self.GENDER = setup_info["gender"]
+        self.AGE = setup_info["age"]
+        self.INTERESTS = setup_info["interests"]
+        self.mode = setup_info.get("mode", "date")
+
+    async def _write_loop(self):
+        while True:
+            frame = await self.outbox.get()
+            await self.ws.send_text(frame.text)
+
+
+def setup_info(index: int) -> dict:
+    # Passé par json.loads comme une vraie requête /setup/info : chaque
+    # utilisateur a ses propres chaînes
+    return json.loads(json.dumps({"age": 18 + index % 40, "gender": "female" if index % 2 else "male",
+                                  "interests": ["music", "sport"], "mode": "chill"}))
+
+
+def populate_current(count: int, ws):
+    registry, rooms = ConnectionRegistry(), {}
+    for index in range(0, count, 2):
+        name = str(uuid.uuid4())
+        for member in (index, index + 1):
+            username = f"user{member}"
+            user = app.User(ws, username, setup_info(member))
+            registry.add(username, user)
+            # Chemin de User.join_room sans l'I/O
+            key = room_key(name)
+            members = rooms.get(key)
+            if members is None:
+                members = rooms[key] = RoomMembers(key)
+            members.add(username)
+            user.my_rooms.add(members.key)
+    return registry, rooms
+
+
+def populate_legacy(count: int, ws):
+    registry, rooms = {}, {}
+    for index in range(0, count, 2):
+        name = str(uuid.uuid4())
+        for member in (index, index + 1):
+            username = f"user{member}"
+            user = LegacyUser(ws, username, setup_info(member))
+            registry[username] = user
+            # Le nom de room arrive de chaque client dans son propre message "join"
+            room = json.loads(json.dumps(name))
+            if room not in rooms:
+                rooms[room] = set()
+            rooms[room].add(username)
+            user.my_rooms.append(room)
+    return registry, rooms
+
+
+async def measure(populate, count: int) -> float:
+    ws = FakeWebSocket()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = populate(count, ws)
+    await asyncio.sleep(0) # laisser démarrer les tâches d'écriture
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    for user in state[0].values():
+        if user._writer:
+            user._writer.cancel()
+    await asyncio.sleep(0)
+    del state
+    gc.collect()
+    return (after - before) / count
+
+
+async def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'legacy':>12} {'current':>12} {'saved':>7}")
+    for count in args.users:
+        legacy = await measure(populate_legacy, count)
+        current = await measure(populate_current, count)
+        print(f"{count:>8} {legacy:>8.0f} B/u {current:>8.0f} B/u {1 - current / legacy:>6.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""
+Test de charge du registre de connexions : connexions/déconnexions par seconde
+selon la concurrence.
+
+Compare l'ancien schéma (un asyncio.Lock global tenu pendant l'I/O Redis) au
+ConnectionRegistry (verrou par shard de username, I/O hors verrou). La latence
+Redis est simulée par un asyncio.sleep.
+
+Usage (depuis backend/) : python benchmarks/connection_registry.py [--cycles N] [--redis-latency-ms X]
+"""
+import asyncio
+import time
+
+import common
+from registry import ConnectionRegistry
+
+CONCURRENCY = (1, 10, 100, 1000)
+
+
+async def global_lock_cycle(state, username: str, latency: float):
+    lock, users = state
+    # connect : lecture de l'état de reconnexion sous le verrou global
+    async with lock:
+        await asyncio.sleep(latency)
+        users[username] = object()
+    # logout : SET de l'état de reconnexion sous le verrou global
+    async with lock:
+        await asyncio.sleep(latency)
+        users.pop(username, None)
+
+
+async def registry_cycle(registry: ConnectionRegistry, username: str, latency: float):
+    # connect : GETDEL hors verrou, puis transition sous le verrou du shard
+    await asyncio.sleep(latency)
+    user = object()
+    async with registry.lock(username):
+        registry.add(username, user)
+    # logout : retrait sous verrou, SET ensuite
+    async with registry.lock(username):
+        registry.discard(username, user)
+    await asyncio.sleep(latency)
+
+
+async def run(cycle, state, concurrency: int, cycles: int, latency: float) -> float:
+    per_worker = max(1, cycles // concurrency)
+
+    async def worker(worker_id: int):
+        for i in range(per_worker):
+            await cycle(state, f"user{worker_id}_{i}", latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - start)
+
+
+async def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--cycles", type=int, default=2000)
+    parser.add_argument("--redis-latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+    latency = args.redis_latency_ms / 1000
+
+    print(f"{'concurrency':>12} {'global lock (cycles/s)':>24} {'registry (cycles/s)':>21}")
+    for concurrency in CONCURRENCY:
+        legacy = await run(global_lock_cycle, (asyncio.Lock(), {}), concurrency, args.cycles, latency)
+        sharded = await run(registry_cycle, ConnectionRegistry(), concurrency, args.cycles, latency)
+        print(f"{concurrency:>12} {legacy:>24.0f} {sharded:>21.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
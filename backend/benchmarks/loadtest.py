@@ -0,0 +1,251 @@
+"""
+Test de charge WebSocket de bout en bout contre un uvicorn et un Redis locaux.
+
+Chaque client simulé suit le parcours du frontend : /token, /setup/info,
+/setup/mode, ouverture de /ws (confirmée par un aller-retour), /matchmaking/join,
+attente de "matched", "join" de la room puis échange de messages au débit demandé.
+
+Rapporte les percentiles de latence de connexion, de match et d'aller-retour
+des messages (un message revient à son émetteur via broadcast_room), ainsi que
+le CPU et la mémoire du serveur rapportés à 1k connexions (lus dans /proc,
+Linux uniquement).
+
+hcaptcha doit être désactivé dans config.json.
+
+Usage (depuis backend/) :
+    python benchmarks/loadtest.py --spawn --clients 1000
+    python benchmarks/loadtest.py --url http://localhost:5001 --server-pid 1234 --clients 500
+"""
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+import common
+from common import percentile
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def summary(name: str, values: list, unit: float = 1000):
+    # Latences en ms par défaut
+    return (f"{name:<16} n={len(values):<7} p50={percentile(values, 0.5) * unit:8.1f}  "
+            f"p90={percentile(values, 0.9) * unit:8.1f}  p99={percentile(values, 0.99) * unit:8.1f}  "
+            f"max={max(values, default=float('nan')) * unit:8.1f} ms")
+
+
+class ProcessSampler():
+    """CPU (secondes) et RSS (octets) d'un process lus dans /proc."""
+
+    def __init__(self, pid: int | None):
+        self.pid = pid
+
+    def cpu_seconds(self) -> float | None:
+        if not self.pid:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        except OSError:
+            return None
+
+    def rss_bytes(self) -> int | None:
+        if not self.pid:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+
+class Stats():
+    def __init__(self):
+        self.connect = []
+        self.match = []
+        self.rtt = []
+        self.errors = {}
+
+    def error(self, stage: str, e: Exception):
+        key = f"{stage}: {type(e).__name__}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+async def run_client(index: int, run_id: str, args, http: httpx.AsyncClient, stats: Stats,
+                     all_connected: asyncio.Event, connected: list):
+    username = f"lt{run_id}_{index}"
+    ws_url = args.url.replace("http", "ws", 1)
+    gender = "female" if index % 2 else "male"
+    try:
+        response = await http.get("/token", params={"username": username})
+        response.raise_for_status()
+        token = response.json()["token"]
+        headers = {"Authorization": token}
+        (await http.post("/setup/info", headers=headers, json={"age": 25 + index % 10, "gender": gender, "interests": ["music", "sport"]})).raise_for_status()
+        (await http.post("/setup/mode", headers=headers, json={"mode": args.mode})).raise_for_status()
+    except Exception as e:
+        stats.error("setup", e)
+        connected[0] += 1
+        if connected[0] >= args.clients:
+            all_connected.set()
+        return
+
+    ws = None
+    try:
+        start = time.perf_counter()
+        ws = await websockets.connect(f"{ws_url}/ws?token={token}", open_timeout=args.timeout, max_queue=None)
+        # Poignée de main finie ne veut pas dire enregistré côté serveur : un
+        # aller-retour sur la socket (join d'une room privée) garantit que
+        # /matchmaking/join ne reviendra pas en 403
+        probe = f"ready-{username}"
+        await ws.send(json.dumps({"action": "join", "room": probe}))
+        while json.loads(await asyncio.wait_for(ws.recv(), args.timeout)).get("action") != "join":
+            pass
+        await ws.send(json.dumps({"action": "leave_room", "room": probe}))
+        stats.connect.append(time.perf_counter() - start)
+    except Exception as e:
+        stats.error("connect", e)
+        if ws is not None:
+            await ws.close()
+        connected[0] += 1
+        if connected[0] >= args.clients:
+            all_connected.set()
+        return
+
+    connected[0] += 1
+    if connected[0] >= args.clients:
+        all_connected.set()
+
+    try:
+        async with ws:
+            # Tout le monde entre dans la file en même temps
+            await all_connected.wait()
+            start = time.perf_counter()
+            (await http.post("/matchmaking/join", headers=headers)).raise_for_status()
+
+            room = None
+            while room is None:
+                frame = json.loads(await asyncio.wait_for(ws.recv(), args.timeout))
+                if frame.get("action") == "matched":
+                    room = frame["content"]["room"]
+            stats.match.append(time.perf_counter() - start)
+
+            await ws.send(json.dumps({"action": "join", "room": room}))
+            # Laisser au partenaire le temps de rejoindre la room
+            await asyncio.sleep(1)
+
+            async def sender():
+                seq = 0
+                interval = 1 / args.message_rate
+                chat_until = time.perf_counter() + args.duration
+                while time.perf_counter() < chat_until:
+                    await ws.send(json.dumps({"action": "send", "room": room, "message": f"{username}|{seq}|{time.perf_counter()}"}))
+                    seq += 1
+                    await asyncio.sleep(interval)
+
+            async def receiver():
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if frame.get("action") != "receive_message":
+                        continue
+                    content = frame["content"]
+                    if content["from_user"] == username:
+                        sent_at = float(content["message"].rsplit("|", 1)[1])
+                        stats.rtt.append(time.perf_counter() - sent_at)
+
+            receiving = asyncio.create_task(receiver())
+            await sender()
+            # Derniers allers-retours en vol
+            await asyncio.sleep(min(1.0, args.timeout))
+            receiving.cancel()
+    except Exception as e:
+        stats.error("session", e)
+
+
+async def wait_for_server(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as http:
+        while time.monotonic() < deadline:
+            try:
+                if (await http.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    sys.exit(f"Server {url} not reachable")
+
+
+async def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--url", default="http://127.0.0.1:5001")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--ramp", type=float, default=5, help="secondes pour ouvrir toutes les connexions")
+    parser.add_argument("--mode", default="chill", choices=["chill", "date", "interests"])
+    parser.add_argument("--message-rate", type=float, default=1, help="messages/s par client")
+    parser.add_argument("--duration", type=float, default=20, help="secondes d'échange de messages")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--server-pid", type=int, default=None, help="pid du uvicorn à mesurer")
+    parser.add_argument("--spawn", action="store_true", help="lance uvicorn app:app localement")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        port = httpx.URL(args.url).port or 5001
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=common.BACKEND_DIR, stdout=subprocess.DEVNULL,
+        )
+        args.server_pid = server.pid
+
+    try:
+        await wait_for_server(args.url, args.timeout)
+        sampler = ProcessSampler(args.server_pid)
+        stats = Stats()
+        run_id = secrets.token_hex(3)
+        all_connected = asyncio.Event()
+        connected = [0]
+
+        rss_before = sampler.rss_bytes()
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as http:
+            tasks = []
+            for index in range(args.clients):
+                tasks.append(asyncio.create_task(run_client(index, run_id, args, http, stats, all_connected, connected)))
+                await asyncio.sleep(args.ramp / args.clients)
+
+            await all_connected.wait()
+            rss_connected = sampler.rss_bytes()
+            cpu_start, wall_start = sampler.cpu_seconds(), time.perf_counter()
+            await asyncio.gather(*tasks)
+            cpu_end, wall_end = sampler.cpu_seconds(), time.perf_counter()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    print(f"clients: {args.clients}, connected: {len(stats.connect)}, matched: {len(stats.match)}")
+    print(summary("connect", stats.connect))
+    print(summary("match", stats.match))
+    print(summary("message rtt", stats.rtt))
+    per_k = 1000 / max(1, len(stats.connect))
+    if cpu_start is not None and cpu_end is not None:
+        cpu_percent = (cpu_end - cpu_start) / (wall_end - wall_start) * 100
+        print(f"server cpu       {cpu_percent:.1f}% total, {cpu_percent * per_k:.1f}% per 1k connections")
+    if rss_before is not None and rss_connected is not None:
+        print(f"server memory    {rss_connected / 2**20:.1f} MiB rss, {(rss_connected - rss_before) * per_k / 2**20:.1f} MiB per 1k connections")
+    for error, count in sorted(stats.errors.items()):
+        print(f"error            {error} x{count}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,201 @@
+"""
+Simulateur et benchmark du matchmaking.
+
+Pilote MatchMaker comme le fait matchmaking_loop (réveil sur arrivée, lots de
+find_matches par mode) face à un Redis local ou à fakeredis, avec des flux
+synthétiques d'arrivées et de départs sur une file pré-remplie de 1k/10k/100k
+joueurs (genre, âge et intérêts tirés au hasard).
+
+Rapporte par population : matches/s, percentiles du temps d'attente avant
+match, allers-retours Redis par match et blocage de la boucle asyncio.
+
+Avec fakeredis, les scripts Lua s'exécutent dans le process : le blocage de
+boucle mesuré inclut donc le travail que ferait le serveur Redis. Le temps
+d'attente des joueurs pré-chargés inclut la durée du chargement.
+
+Usage (depuis backend/) :
+    python benchmarks/matchmaking.py                      # fakeredis
+    python benchmarks/matchmaking.py --redis-url redis://localhost:6380/15
+    python benchmarks/matchmaking.py --population 1000 --duration 5
+"""
+import asyncio
+import random
+import sys
+import time
+
+import common
+from common import percentile
+from matchmacker import MatchMaker
+
+MODES = ("chill", "date", "interests")
+MODE_WEIGHTS = (0.3, 0.5, 0.2)
+INTERESTS = [f"interest{i}" for i in range(50)]
+# Quelques intérêts très populaires, une longue traîne d'intérêts rares
+INTEREST_WEIGHTS = [1 / (rank + 1) for rank in range(len(INTERESTS))]
+
+
+class RedisCounter():
+    """Compte les allers-retours Redis (commandes, scripts et pipelines)."""
+
+    def __init__(self, client):
+        self.round_trips = 0
+        execute_command = client.execute_command
+        pipeline = client.pipeline
+
+        async def counted_execute_command(*args, **kwargs):
+            self.round_trips += 1
+            return await execute_command(*args, **kwargs)
+
+        def counted_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def counted_execute(*a, **kw):
+                self.round_trips += 1
+                return await execute(*a, **kw)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        client.execute_command = counted_execute_command
+        client.pipeline = counted_pipeline
+
+
+class LoopLagMonitor():
+    """Mesure le retard de réveil d'un timer : le temps où la boucle était bloquée."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+def make_client(redis_url: str | None):
+    if redis_url:
+        import redis.asyncio as aioredis
+        return aioredis.Redis.from_url(redis_url, decode_responses=True)
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis[lua] n'est pas installé : pip install 'fakeredis[lua]' ou passer --redis-url")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+def random_player(rng: random.Random, index: int):
+    gender = "female" if rng.random() < 0.45 else "male"
+    age = min(70, max(18, int(rng.gauss(28, 7))))
+    interests = rng.choices(INTERESTS, weights=INTEREST_WEIGHTS, k=rng.randint(1, 5))
+    mode = rng.choices(MODES, weights=MODE_WEIGHTS)[0]
+    return f"sim{index}", gender, age, interests, mode
+
+
+async def simulate(population: int, args) -> dict:
+    rng = random.Random(args.seed)
+    client = make_client(args.redis_url)
+    await client.flushdb()
+    match_maker = MatchMaker(redis=client)
+    await match_maker.load_scripts()
+
+    waiting = {} # username -> mode
+    next_index = 0
+
+    async def arrive():
+        nonlocal next_index
+        username, gender, age, interests, mode = random_player(rng, next_index)
+        next_index += 1
+        waiting[username] = mode
+        await match_maker.add_player(username, gender, age, interests, mode)
+
+    # File pré-remplie, sans appariement pendant le chargement
+    for _ in range(population):
+        await arrive()
+
+    counter = RedisCounter(client)
+    monitor = LoopLagMonitor()
+    monitor.start()
+    stop = asyncio.Event()
+    matches = 0
+    waits = [] # attente de chaque joueur apparié, sur toute la durée du run
+
+    async def arrivals():
+        # Processus de Poisson d'arrivées ; chaque arrivée a une chance de
+        # faire partir un joueur en attente (onglet fermé, abandon...)
+        while not stop.is_set():
+            await asyncio.sleep(rng.expovariate(args.arrival_rate))
+            await arrive()
+            if waiting and rng.random() < args.departure_ratio:
+                username = rng.choice(list(waiting))
+                await match_maker.remove_player(username, waiting.pop(username), ignore_error=True)
+
+    async def matchmaking():
+        nonlocal matches
+        while not stop.is_set():
+            await match_maker.wait_for_players(args.fallback_interval)
+            for mode in MODES:
+                found = await match_maker.find_matches(mode, args.batch_size)
+                matches += len(found)
+                now = time.time()
+                for pair in found:
+                    for player in pair:
+                        waiting.pop(player["username"], None)
+                        waits.append(now - player["join_time"])
+                if len(found) >= args.batch_size:
+                    match_maker.wakeup.set()
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(arrivals()), asyncio.create_task(matchmaking())]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    match_maker.wakeup.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+
+    await client.flushdb()
+    return {
+        "population": population,
+        "matches_per_sec": matches / elapsed,
+        "wait_p50": percentile(waits, 0.50),
+        "wait_p99": percentile(waits, 0.99),
+        "ops_per_match": counter.round_trips / matches if matches else float("nan"),
+        "lag_p99_ms": percentile(monitor.lags, 0.99) * 1000,
+        "lag_max_ms": max(monitor.lags, default=0) * 1000,
+        "still_waiting": len(waiting),
+    }
+
+
+async def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--population", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--duration", type=float, default=10, help="secondes simulées par population")
+    parser.add_argument("--arrival-rate", type=float, default=200, help="arrivées par seconde")
+    parser.add_argument("--departure-ratio", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--fallback-interval", type=float, default=1)
+    parser.add_argument("--redis-url", default=None, help="Redis local dédié (la base est vidée !) ; fakeredis sinon")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'waiting':>8} {'matches/s':>10} {'wait p50':>9} {'wait p99':>9} {'ops/match':>10} {'lag p99':>8} {'lag max':>8} {'left':>7}")
+    for population in args.population:
+        r = await simulate(population, args)
+        print(f"{r['population']:>8} {r['matches_per_sec']:>10.1f} {r['wait_p50']:>8.2f}s {r['wait_p99']:>8.2f}s "
+              f"{r['ops_per_match']:>10.2f} {r['lag_p99_ms']:>6.1f}ms {r['lag_max_ms']:>6.1f}ms {r['still_waiting']:>7}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+"""
+Microbenchmark du chemin chaud d'un message de room.
+
+Compare le coût CPU par message relayé :
+- avant : un dict construit puis json.dumps pour chaque destinataire (send_json)
+- après : un seul codec.dumps, le même texte mis en file pour chaque destinataire
+
+Usage (depuis backend/) : python benchmarks/message_fanout.py [--messages N]
+"""
+import json
+import time
+from collections import deque
+
+import common
+import codec
+
+ROOM_SIZES = (2, 10, 100)
+MESSAGE = "Salut ! Ça va ? On se retrouve ce soir vers 21h près de la gare ?"
+ROOM = "0b5e7c1e-6a4f-4a55-9a35-7f6f0d0e2c11"
+
+
+def relay_before(members, outbox):
+    # Ancien User.relay_message : un dict et une sérialisation par destinataire
+    for _ in members:
+        frame = {"action": "receive_message", "content": {"message": MESSAGE, "from_user": "alice", "from_room": ROOM}}
+        outbox.append(json.dumps(frame, separators=(",", ":"), ensure_ascii=False))
+
+
+def relay_after(members, outbox):
+    frame = codec.dumps({"action": "receive_message", "content": {"message": MESSAGE, "from_user": "alice", "from_room": ROOM}})
+    for _ in members:
+        outbox.append(frame)
+
+
+def cpu_per_message(relay, room_size: int, messages: int) -> float:
+    members = range(room_size)
+    outbox = deque(maxlen=room_size)
+    start = time.process_time()
+    for _ in range(messages):
+        relay(members, outbox)
+    return (time.process_time() - start) / messages * 1e6
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"codec: {codec.CODEC}")
+    print(f"{'room size':>10} {'before (µs)':>12} {'after (µs)':>12} {'speedup':>8}")
+    for size in ROOM_SIZES:
+        before = cpu_per_message(relay_before, size, args.messages)
+        after = cpu_per_message(relay_after, size, args.messages)
+        print(f"{size:>10} {before:>12.2f} {after:>12.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
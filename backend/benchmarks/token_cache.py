@@ -0,0 +1,70 @@
+"""
+Coût de l'authentification par requête, avec et sans le cache de TokenVerifier.
+
+Simule des requêtes authentifiées (polling de /token/validate, /setup/*,
+/matchmaking/join, /ws) tirées parmi une population de tokens actifs. Sans
+cache, chaque requête refait jwt.decode (HMAC + parsing JSON) ; avec le cache,
+seule la première requête d'un token le fait. Une population plus grande que
+le cache montre le coût des évictions.
+
+Usage (depuis backend/) : python benchmarks/token_cache.py [--requests N] [--cache-size N]
+"""
+import random
+import time
+from datetime import datetime, timedelta, UTC
+
+import jwt
+
+import common
+from tokens import TokenVerifier
+
+SECRET_KEY = "benchmark-secret-key-benchmark-secret-key"
+ALGORITHM = "HS256"
+POPULATIONS = (100, 10000, 100000)
+
+
+def make_tokens(count: int) -> list:
+    expire = datetime.now(UTC) + timedelta(minutes=60)
+    return [jwt.encode({"sub": f"user{i}", "exp": expire, "jti": f"{i:016x}"}, SECRET_KEY, algorithm=ALGORITHM) for i in range(count)]
+
+
+def run(verify, requests: list) -> float:
+    start = time.perf_counter()
+    for token in requests:
+        verify(token)
+    return (time.perf_counter() - start) / len(requests)
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'tokens':>8} {'no cache':>11} {'cache':>11} {'speedup':>8} {'hit rate':>9}")
+    for population in POPULATIONS:
+        tokens = make_tokens(population)
+        requests = [rng.choice(tokens) for _ in range(args.requests)]
+
+        uncached = TokenVerifier(SECRET_KEY, ALGORITHM)
+        no_cache = run(uncached.decode, requests)
+
+        cached = TokenVerifier(SECRET_KEY, ALGORITHM, args.cache_size)
+        decodes = [0]
+        decode = cached.decode
+
+        def counted_decode(token):
+            decodes[0] += 1
+            return decode(token)
+
+        cached.decode = counted_decode
+        with_cache = run(cached.verify, requests)
+        hit_rate = 1 - decodes[0] / len(requests)
+
+        print(f"{population:>8} {no_cache * 1e6:>9.2f}us {with_cache * 1e6:>9.2f}us {no_cache / with_cache:>7.1f}x {hit_rate:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Équité de la boucle /ws face à un client qui inonde le serveur.
+
+Fait tourner le vrai ws_endpoint d'app.py sur de fausses WebSockets, dans le
+process (backplane local, sessions en mémoire, pas de Redis). Des paires
+d'utilisateurs normaux s'échangent un message par seconde pendant qu'un
+client abusif, dont les frames sont déjà tous en tampon comme après une
+rafale TCP, envoie sans arrêt dans sa room.
+
+Rapporte la latence des utilisateurs normaux (de la réception du frame à la
+mise en file de l'écho) sans abusif, puis avec, limites désactivées et
+activées (valeurs de config.json), ainsi que les frames de l'abusif relayés.
+
+Usage (depuis backend/) : python benchmarks/ws_flood.py [--users 200] [--duration 5]
+"""
+import asyncio
+import json
+import logging
+import time
+
+import jwt
+from fastapi import WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+import common
+from common import percentile
+import app
+import logs
+import metrics
+from ratelimit import RateLimiter
+from sessions import MemorySessionStore
+
+PROFILE = {"age": 25, "gender": "female", "interests": ["music"], "mode": "chill"}
+
+
+class FakeWebSocket():
+    """Juste ce que ws_endpoint et User utilisent d'une WebSocket Starlette."""
+
+    def __init__(self, username: str):
+        token = jwt.encode({"sub": username, "exp": time.time() + 3600}, app.SECRET_KEY, algorithm=app.ALGORITHM)
+        self.query_params = {"token": token}
+        self.scope = {"subprotocols": []}
+        self.client_state = WebSocketState.CONNECTED
+        self.incoming = asyncio.Queue()
+        self.on_text = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def receive_text(self) -> str:
+        data = await self.incoming.get()
+        if data is None:
+            raise WebSocketDisconnect()
+        return data
+
+    async def send_text(self, text: str):
+        if self.on_text:
+            self.on_text(text)
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        self.client_state = WebSocketState.DISCONNECTED
+        self.incoming.put_nowait(None)
+
+
+async def connect(username: str, room: str) -> FakeWebSocket:
+    await app.sessions.set(username, PROFILE)
+    ws = FakeWebSocket(username)
+    asyncio.create_task(app.ws_endpoint(ws))
+    ws.incoming.put_nowait(json.dumps({"action": "join", "room": room}))
+    return ws
+
+
+async def scenario(users: int, duration: float, flood: bool, limited: bool) -> dict:
+    app.sessions = MemorySessionStore(3600)
+    if limited:
+        app.user_limiter = RateLimiter(app.config["limits"]["user_rate"], app.config["limits"]["user_burst"])
+        app.room_limiter = RateLimiter(app.config["limits"]["room_rate"], app.config["limits"]["room_burst"])
+    else:
+        app.user_limiter = app.room_limiter = RateLimiter(float("inf"), float("inf"))
+    relayed_before = metrics.MESSAGES_RELAYED.values.get((), 0)
+    run_id = time.monotonic_ns()
+
+    latencies = []
+    clients = []
+    for index in range(users):
+        username = f"n{run_id}_{index}"
+        ws = await connect(username, f"room{run_id}_{index // 2}")
+        sent = {}
+
+        def on_text(text, username=username, sent=sent):
+            frame = json.loads(text)
+            if frame.get("action") == "receive_message" and frame["content"]["from_user"] == username:
+                latencies.append(time.perf_counter() - sent.pop(frame["content"]["message"]))
+
+        ws.on_text = on_text
+        clients.append((ws, sent))
+
+    abuser = None
+    if flood:
+        abuser = await connect(f"abuser{run_id}", f"room{run_id}_flood")
+        await connect(f"victim{run_id}", f"room{run_id}_flood")
+        flood_frame = json.dumps({"action": "send", "room": f"room{run_id}_flood", "message": "x" * 100})
+
+    await asyncio.sleep(0.1) # connexions et "join" traités
+    stop = time.perf_counter() + duration
+
+    async def normal_user(ws, sent, room, offset):
+        await asyncio.sleep(offset)
+        seq = 0
+        while time.perf_counter() < stop:
+            message = f"m{seq}"
+            sent[message] = time.perf_counter()
+            ws.incoming.put_nowait(json.dumps({"action": "send", "room": room, "message": message}))
+            seq += 1
+            await asyncio.sleep(1)
+
+    async def flooder():
+        while time.perf_counter() < stop:
+            # Toujours des frames en tampon : receive_text ne suspend jamais
+            while abuser.incoming.qsize() < 1000:
+                abuser.incoming.put_nowait(flood_frame)
+            await asyncio.sleep(0.001)
+
+    tasks = [asyncio.create_task(normal_user(ws, sent, f"room{run_id}_{index // 2}", index / users))
+             for index, (ws, sent) in enumerate(clients)]
+    if flood:
+        tasks.append(asyncio.create_task(flooder()))
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0.2)
+
+    for ws, _ in clients:
+        await ws.close()
+    if abuser:
+        await abuser.close()
+    await asyncio.sleep(0.1)
+    relayed = metrics.MESSAGES_RELAYED.values.get((), 0) - relayed_before
+    return {
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "delivered": len(latencies),
+        "abuser_relayed": relayed - len(latencies),
+    }
+
+
+async def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5)
+    args = parser.parse_args()
+    # logs.setup() donne un niveau explicite à chaque module configuré : les faire taire un par un
+    for name in ["wisp", *(f"wisp.{module}" for module in logs.LOG_CONFIG["modules"])]:
+        logging.getLogger(name).setLevel("ERROR")
+
+    print(f"{'scenario':<22} {'p50':>9} {'p99':>9} {'delivered':>10} {'abuser relayed':>15}")
+    for name, flood, limited in (("no flood", False, True), ("flood, no limits", True, False), ("flood, limits", True, True)):
+        r = await scenario(args.users, args.duration, flood, limited)
+        print(f"{name:<22} {r['p50']:>7.2f}ms {r['p99']:>7.2f}ms {r['delivered']:>10} {r['abuser_relayed']:>15}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
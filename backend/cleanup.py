@@ -0,0 +1,125 @@
+import asyncio
+from redis.exceptions import NoScriptError
+import logs
+import metrics
+
+logger = logs.get_logger("cleanup")
+
+LOGOUT_BATCH_SIZE = metrics.Histogram("wisp_logout_batch_size", "Logouts cleaned up per Redis round trip", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class LogoutBatcher():
+    """
+    Nettoyage Redis des déconnexions, regroupé : sauvegarde du profil pour la
+    reconnexion, retrait de toutes les files de matchmaking et libération de
+    la propriété du username partent dans un seul pipeline par lot.
+
+    Un lot part dès que le précédent est terminé, au plus une fois par
+    `interval` : une vague de déconnexions (déploiement, coupure réseau)
+    coûte quelques allers-retours au lieu de plusieurs par utilisateur, et
+    un seul pipeline est en vol à la fois. Un lot qui échoue est remis en
+    attente et renvoyé au passage suivant.
+    """
+
+    def __init__(self, redis, match_maker, sessions, backplane, modes, reconnect_ttl: int,
+                 interval: float = 0.05, max_batch: int = 500):
+        self.redis = redis
+        self.match_maker = match_maker
+        self.sessions = sessions
+        self.backplane = backplane
+        self.modes = modes
+        self.reconnect_ttl = reconnect_ttl
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = {} # username -> profil à sauvegarder (ou None)
+        # Entrées dont le pipeline est en cours d'envoi : username -> (profil,
+        # future résolue quand leur lot est écrit)
+        self.inflight = {}
+        self.wakeup = asyncio.Event()
+
+    def add(self, username: str, profile: dict | None):
+        self.pending[username] = profile
+        self.wakeup.set()
+
+    async def reclaim(self, username: str) -> dict | None:
+        """
+        Reconnexion avant le nettoyage : l'entrée est abandonnée (l'utilisateur
+        reste dans sa file, comme s'il ne s'était jamais déconnecté) et son
+        profil rendu directement, sans passer par Redis.
+
+        Si le lot qui le contient est déjà parti, on attend qu'il soit écrit :
+        sinon la lecture de la session pourrait passer avant sa sauvegarde, et
+        la libération du username après son nouvel enregistrement. La session
+        est lue sans être supprimée : l'appelant la retire une fois
+        l'utilisateur enregistré.
+        """
+        if username in self.pending:
+            return self.pending.pop(username)
+        if username in self.inflight:
+            profile, sent = self.inflight[username]
+            await asyncio.shield(sent)
+            if username in self.pending:
+                # Lot en échec, remis en attente : abandonné comme ci-dessus
+                return self.pending.pop(username)
+            return await self.sessions.get(username) or profile
+        return None
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("logout cleanup failed")
+            await asyncio.sleep(self.interval)
+
+    async def flush(self):
+        while self.pending:
+            batch = {}
+            for username in list(self.pending)[:self.max_batch]:
+                batch[username] = self.pending.pop(username)
+            LOGOUT_BATCH_SIZE.observe(len(batch))
+
+            # Deux flush peuvent se chevaucher (celui de l'arrêt et celui de run) :
+            # chaque lot a sa propre future
+            sent = asyncio.get_running_loop().create_future()
+            for username, profile in batch.items():
+                self.inflight[username] = (profile, sent)
+            try:
+                results = await self._send(batch)
+                if any(isinstance(result, NoScriptError) for result in results):
+                    # Scripts perdus côté Redis (redémarrage, SCRIPT FLUSH) : le lot
+                    # est idempotent, on le rejoue une fois les scripts rechargés
+                    logger.warning("cleanup scripts missing, reloading")
+                    await self.match_maker.load_scripts()
+                    await self.backplane.load_scripts()
+                    results = await self._send(batch)
+            except BaseException:
+                # Lot perdu en route (connexion, timeout, annulation) : il est
+                # idempotent, on le remet en attente pour que run() le renvoie.
+                # Avant de résoudre `sent`, pour que reclaim le retrouve.
+                for username, profile in batch.items():
+                    self.pending.setdefault(username, profile)
+                self.wakeup.set()
+                raise
+            finally:
+                for username in batch:
+                    if self.inflight.get(username, (None, None))[1] is sent:
+                        del self.inflight[username]
+                sent.set_result(None)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                logger.warning("logout cleanup errors", errors=len(errors), first=repr(errors[0]))
+
+    async def _send(self, batch: dict) -> list:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for username, profile in batch.items():
+                if profile is not None:
+                    await self.sessions.queue_set(pipe, username, profile, ttl=self.reconnect_ttl)
+                await self.match_maker.queue_remove(pipe, username, self.modes)
+                await self.backplane.queue_release(pipe, username)
+            # Un échec isolé ne doit pas faire perdre le reste du lot
+            return await pipe.execute(raise_on_error=False)
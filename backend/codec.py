@@ -0,0 +1,120 @@
+import json
+
+# Codec JSON choisi au démarrage : orjson s'il est installé, sinon la stdlib.
+# dumps retourne toujours du texte, prêt pour ws.send_text.
+try:
+    import orjson
+
+    CODEC = "orjson"
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+except ImportError:
+    CODEC = "json"
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    loads = json.loads
+
+# Sous-protocole binaire optionnel (MessagePack), négocié sur /ws
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = "wisp.msgpack"
+
+# Codes d'action du protocole binaire. Les frames sont des tableaux :
+#   serveur -> client : [code, content]            (réponses)
+#                       [ERROR, error]
+#                       [RECEIVE_MESSAGE, message, from_user, from_room, seq]
+#                       [PING, None]
+#   client -> serveur : [JOIN, room] ou [JOIN, room, since] / [LEAVE_ROOM, room] / [SEND, room, message]
+#                       [PONG]
+# Une action sans code est envoyée avec son nom à la place du code.
+ACTION_CODES = {
+    "join": 1,
+    "leave_room": 2,
+    "send": 3,
+    "receive_message": 4,
+    "matched": 5,
+    "user_left": 6,
+    "error": 7,
+    "ping": 8,
+    "pong": 9,
+    "history": 10,
+}
+ACTION_NAMES = {code: action for action, code in ACTION_CODES.items()}
+
+
+class FrameError(ValueError):
+    pass
+
+
+# orjson.JSONDecodeError hérite de json.JSONDecodeError
+DecodeError = (json.JSONDecodeError, FrameError)
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def pack(payload: dict) -> bytes:
+    action = payload["action"]
+    code = ACTION_CODES.get(action, action)
+    if action == "receive_message":
+        content = payload["content"]
+        return msgpack.packb([code, content["message"], content["from_user"], content["from_room"], content.get("seq")])
+    if action == "error":
+        return msgpack.packb([code, payload["error"]])
+    return msgpack.packb([code, payload["content"]])
+
+
+def unpack_request(data: bytes) -> dict:
+    """Décode un frame client binaire vers le même dict que le protocole JSON."""
+    try:
+        frame = msgpack.unpackb(data)
+        action = ACTION_NAMES.get(frame[0], frame[0])
+        if action == "send":
+            return {"action": action, "room": frame[1], "message": frame[2]}
+        if action == "pong":
+            return {"action": action}
+        if action == "join" and len(frame) > 2:
+            return {"action": action, "room": frame[1], "since": frame[2]}
+        return {"action": action, "room": frame[1]}
+    except (ValueError, TypeError, IndexError, KeyError) as e:
+        raise FrameError(f"Invalid binary frame: {e}")
+
+
+class Frame():
+    """
+    Frame sortant, encodé paresseusement au plus une fois par protocole puis
+    partagé par tous les destinataires.
+    """
+    __slots__ = ("_payload", "_text", "_packed")
+
+    def __init__(self, payload: dict | None = None, text: str | None = None):
+        self._payload = payload
+        self._text = text
+        self._packed = None
+
+    @property
+    def payload(self) -> dict:
+        if self._payload is None:
+            self._payload = loads(self._text)
+        return self._payload
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self._payload)
+        return self._text
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            self._packed = pack(self.payload)
+        return self._packed
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import OrderedDict
+import httpx
+import logs
+
+logger = logs.get_logger("hcaptcha")
+
+
+class HCaptchaVerifier():
+    """
+    Vérification hCaptcha via un client httpx partagé (pool keep-alive, délais
+    stricts, connexions simultanées bornées), démarré et fermé par le lifespan.
+
+    Un token déjà vérifié garde son résultat cache_ttl secondes : un /token
+    rejoué par le client ne repart pas chez hCaptcha (qui refuserait un token
+    déjà consommé), et deux vérifications simultanées du même token partagent
+    la même requête.
+    """
+
+    def __init__(self, secret_key: str, verify_url: str, timeout: float = 5, max_connections: int = 20,
+                 cache_ttl: float = 60, cache_size: int = 10000, transport: httpx.AsyncBaseTransport | None = None):
+        self.secret_key = secret_key
+        self.verify_url = verify_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.transport = transport # injectable, pour viser un serveur de test
+        self.client = None
+        self._results = OrderedDict() # token -> (succès, expiration)
+        self._pending = {} # token -> Future d'une vérification en cours
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            transport=self.transport,
+        )
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def verify(self, token: str) -> bool:
+        now = time.monotonic()
+        cached = self._results.get(token)
+        if cached is not None:
+            if cached[1] > now:
+                return cached[0]
+            del self._results[token]
+
+        pending = self._pending.get(token)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[token] = future
+        try:
+            success = await self._siteverify(token)
+            future.set_result(bool(success))
+        finally:
+            self._pending.pop(token, None)
+            if not future.done():
+                future.set_result(False)
+        if success is None:
+            # Erreur réseau : refusé, mais pas mis en cache pour permettre un nouvel essai
+            return False
+        self._results[token] = (success, time.monotonic() + self.cache_ttl)
+        if len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+        return success
+
+    async def _siteverify(self, token: str) -> bool | None:
+        try:
+            response = await self.client.post(self.verify_url, data={"secret": self.secret_key, "response": token})
+            response.raise_for_status()
+            return bool(response.json().get("success", False))
+        except (httpx.HTTPError, ValueError) as e:
+            # Échec fermé : sans réponse d'hCaptcha, pas de token
+            logger.warning("hcaptcha verification failed", event="hcaptcha_error", error=repr(e))
+            return None
@@ -0,0 +1,107 @@
+import asyncio
+import math
+import time
+import logs
+import metrics
+
+logger = logs.get_logger("heartbeat")
+
+CONNECTIONS_REAPED = metrics.Counter("wisp_connections_reaped_total", "Connections closed after missing heartbeats")
+PINGS_SENT = metrics.Counter("wisp_heartbeat_pings_total", "Heartbeat pings sent to idle connections")
+
+
+class TimerWheel():
+    """
+    Roue de timers hachée : `slots` ensembles parcourus circulairement, un par
+    tick. Programmer une échéance coûte un ajout dans un ensemble, avancer d'un
+    tick ne touche que les éléments arrivés à échéance ; aucun coût par
+    élément entre deux passages. Les délais sont arrondis au tick supérieur et
+    bornés à un tour de roue.
+    """
+
+    def __init__(self, tick: float, horizon: float):
+        self.tick = tick
+        self.slots = [set() for _ in range(math.ceil(horizon / tick) + 1)]
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        return sum(len(slot) for slot in self.slots)
+
+    def schedule(self, item, delay: float):
+        ticks = min(len(self.slots) - 1, max(1, math.ceil(delay / self.tick)))
+        self.slots[(self.cursor + ticks) % len(self.slots)].add(item)
+
+    def advance(self) -> set:
+        """Avance d'un tick et retourne (en les retirant) les éléments échus."""
+        self.cursor = (self.cursor + 1) % len(self.slots)
+        due = self.slots[self.cursor]
+        self.slots[self.cursor] = set()
+        return due
+
+
+class HeartbeatReaper():
+    """
+    Détection des connexions mortes (TCP semi-ouvert, mobile passé hors
+    réseau) avec une seule tâche pour tout le process.
+
+    Chaque connexion a un `last_seen` mis à jour à chaque frame reçu, sans
+    toucher à la roue : la connexion n'y est réexaminée qu'à sa prochaine
+    échéance. Inactive depuis `interval`, elle reçoit un ping (le client
+    répond "pong", ce qui compte comme activité) ; sans nouvelles depuis
+    `timeout`, elle est déconnectée par `logout()`. Une connexion déjà
+    déconnectée (`active` faux) sort de la roue à son prochain passage.
+    """
+
+    def __init__(self, interval: float, timeout: float, tick: float, ping_frame):
+        if timeout <= interval:
+            raise ValueError("heartbeat timeout must be greater than interval")
+        self.interval = interval
+        self.timeout = timeout
+        self.ping_frame = ping_frame
+        self.wheel = TimerWheel(tick, timeout)
+
+    def __len__(self) -> int:
+        return len(self.wheel)
+
+    def watch(self, user):
+        self.wheel.schedule(user, self.interval)
+
+    async def run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.wheel.tick
+            # Après un retard de la boucle, les ticks manqués sont rattrapés sans attente
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            try:
+                await self.check(self.wheel.advance())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("heartbeat check failed")
+
+    async def check(self, due: set):
+        now = time.monotonic()
+        stale = []
+        for user in due:
+            if not user.active:
+                continue
+            idle = now - user.last_seen
+            if idle >= self.timeout:
+                stale.append(user)
+                continue
+            if idle >= self.interval:
+                user.send_frame(self.ping_frame)
+                PINGS_SENT.inc()
+                # Ping suivant dans `interval`, sans dépasser l'expiration
+                self.wheel.schedule(user, min(self.interval, self.timeout - idle))
+            else:
+                # Activité récente : prochain examen quand elle aura `interval`
+                self.wheel.schedule(user, self.interval - idle)
+
+        if stale:
+            CONNECTIONS_REAPED.inc(amount=len(stale))
+            logger.info("reaping stale connections", event="reap", count=len(stale))
+            results = await asyncio.gather(*(user.logout() for user in stale), return_exceptions=True)
+            for user, result in zip(stale, results):
+                if isinstance(result, Exception):
+                    logger.warning("error reaping connection", user=user.username, error=repr(result))
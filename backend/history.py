@@ -0,0 +1,106 @@
+import itertools
+import re
+import time
+from collections import OrderedDict, deque
+import codec
+from models import room_key
+
+# Historique borné des messages de chaque room, pour rattraper ce qui a été
+# relayé pendant une coupure. Chaque message reçoit un `seq` croissant, envoyé
+# au client avec le message ; "join" accepte le dernier seq vu (`since`) et le
+# serveur renvoie les messages manqués en un seul frame "history".
+#   entrée : {"message": str, "from_user": str, "from_room": str, "seq": ...}
+# Le seq est opaque pour le client : il se contente de le renvoyer.
+
+STREAM_ID_PATTERN = re.compile(r"^\d+(-\d+)?$")
+
+
+class MemoryRoomHistory():
+    """
+    Ring buffer de `size` messages par room, dans le process : pour un seul
+    noeud (backplane "local"). Le buffer d'une room est oublié quand son
+    dernier membre la quitte, et au plus `max_rooms` rooms sont gardées, les
+    moins récemment actives oubliées en premier.
+    """
+
+    def __init__(self, size: int, max_rooms: int = 10000):
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict() # room_key -> deque((seq, message, from_user))
+        # Seq global au process, initialisé sur l'horloge : après un redémarrage
+        # les nouveaux seq restent supérieurs à ceux que les clients ont déjà vus
+        self._seq = itertools.count(time.time_ns() // 1000)
+
+    async def append(self, room_name: str, message, from_user: str) -> int:
+        seq = next(self._seq)
+        key = room_key(room_name)
+        buffer = self._rooms.get(key)
+        if buffer is None:
+            buffer = self._rooms[key] = deque(maxlen=self.size)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(key)
+        buffer.append((seq, message, from_user))
+        return seq
+
+    async def forget(self, room_name: str):
+        self._rooms.pop(room_key(room_name), None)
+
+    async def since(self, room_name: str, since, limit: int) -> list:
+        try:
+            since = int(since)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid history cursor: {since!r}")
+        buffer = self._rooms.get(room_key(room_name))
+        if not buffer:
+            return []
+        missed = []
+        # Du plus récent au plus ancien : on s'arrête au premier message déjà vu
+        for seq, message, from_user in reversed(buffer):
+            if seq <= since or len(missed) >= limit:
+                break
+            missed.append({"message": message, "from_user": from_user, "from_room": room_name, "seq": seq})
+        missed.reverse()
+        return missed
+
+
+class RedisRoomHistory():
+    """
+    Historique en Redis Stream `{prefix}:{room}`, tronqué à environ `size`
+    entrées (MAXLEN ~) et expirant `ttl` secondes après le dernier message :
+    partagé entre noeuds, le seq est l'ID de l'entrée dans le stream.
+    """
+
+    def __init__(self, redis, prefix: str, size: int, ttl: int):
+        self.redis = redis
+        self.prefix = prefix
+        self.size = size
+        self.ttl = ttl
+
+    def key(self, room_name: str) -> str:
+        return f"{self.prefix}:{room_name}"
+
+    async def append(self, room_name: str, message, from_user: str) -> str:
+        stream = self.key(room_name)
+        # Le message est gardé en JSON : un client peut envoyer autre chose qu'une
+        # chaîne, il doit être rejoué tel quel. XADD et EXPIRE en un aller-retour.
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(stream, {"message": codec.dumps(message), "from_user": from_user}, maxlen=self.size, approximate=True)
+            pipe.expire(stream, self.ttl)
+            seq, _ = await pipe.execute()
+        return seq
+
+    async def forget(self, room_name: str):
+        # Le stream peut servir aux membres d'autres noeuds : il expire avec son ttl
+        pass
+
+    async def since(self, room_name: str, since, limit: int) -> list:
+        since = str(since)
+        if not STREAM_ID_PATTERN.match(since):
+            raise ValueError(f"Invalid history cursor: {since!r}")
+        # Les `limit` plus récents après `since` (borne exclusive), remis dans l'ordre
+        entries = await self.redis.xrevrange(self.key(room_name), max="+", min=f"({since}", count=limit)
+        entries.reverse()
+        return [{"message": codec.loads(fields["message"]), "from_user": fields["from_user"], "from_room": room_name, "seq": seq}
+                for seq, fields in entries]
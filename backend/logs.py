@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import metrics
+
+# Logs structurés (une ligne JSON par record). La boucle asyncio ne fait que
+# déposer le record dans une file bornée : le formatage et l'écriture sur
+# stdout sont faits par le thread du QueueListener. Si la sortie ne suit pas,
+# les records en trop sont abandonnés (et comptés) plutôt que de bloquer.
+
+with open('config.json') as f:
+    config = json.load(f)
+
+LOG_CONFIG = config["logging"]
+SAMPLING = LOG_CONFIG["sampling"] # {event: proportion de records conservés}
+
+LOGS_DROPPED = metrics.Counter("wisp_log_records_dropped_total", "Log records dropped because the log queue was full")
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui n'attend jamais : file pleine -> record abandonné."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # La trace d'exception doit être mise en texte avant de changer de thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOGS_DROPPED.inc()
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    logger.info("match found", event="match", mode=mode, room=room_id)
+
+    Les arguments nommés deviennent des champs du record JSON. Un `event`
+    présent dans la config "sampling" n'est gardé que dans cette proportion
+    (le champ sample_rate permet de repondérer les comptes).
+    """
+
+    def __init__(self, logger: logging.Logger):
+        super().__init__(logger, {})
+
+    def log(self, level: int, msg, *args, **kwargs):
+        if not self.isEnabledFor(level):
+            return
+        rate = SAMPLING.get(kwargs.get("event"))
+        if rate is not None:
+            if random.random() >= rate:
+                return
+            kwargs["sample_rate"] = rate
+        msg, kwargs = self.process(msg, kwargs)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        options = {key: kwargs.pop(key) for key in ("exc_info", "stack_info", "stacklevel") if key in kwargs}
+        options["extra"] = {"fields": kwargs}
+        return msg, options
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(f"wisp.{name}"))
+
+
+def setup():
+    global _listener
+    if _listener:
+        return
+    root = logging.getLogger("wisp")
+    root.setLevel(LOG_CONFIG["level"])
+    root.propagate = False
+    for name, level in LOG_CONFIG["modules"].items():
+        logging.getLogger(f"wisp.{name}").setLevel(level)
+
+    log_queue = queue.Queue(maxsize=LOG_CONFIG["queue_size"])
+    root.addHandler(AsyncQueueHandler(log_queue))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Vide la file puis arrête le thread d'écriture."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+setup()
@@ -1,8 +1,11 @@
 import asyncio
 from typing import Literal
-import redis.asyncio as aioredis
 import json
 import time
+import uuid
+from redis.exceptions import NoScriptError
+from metrics import InstrumentedRedis
+import logs
 
 with open('config.json') as f:
     config = json.load(f)
@@ -12,106 +15,480 @@ REDIS_PORT = config["redis"]["port"]
 REDIS_DB = config["redis"]["db"]
 REDIS_PASSWORD = config["redis"]["password"]
 REDIS_MATCHMAKER_KEY = config["redis"]["redis_keys"]["matchmaking"]
+SCAN_LIMIT = config["match"]["scan_limit"]
+TARGETS = config["match"]["targets"]
+DATE_CONFIG = config["match"]["date"]
+INTERESTS_CONFIG = config["match"]["interests"]
+
+logger = logs.get_logger("matchmaking")
+
+# Scripts Lua exécutés côté Redis : chaque opération est atomique, deux workers
+# partageant le même REDIS_MATCHMAKER_KEY ne peuvent donc jamais réclamer le
+# même joueur, et un match ne coûte qu'un aller-retour.
+
+# KEYS[1] = hash des joueurs, KEYS[2..] = index du mode ; ARGV[1] = joueur,
+# ARGV[2] = préfixe de l'index inversé des intérêts (mode interests uniquement)
+TAKE_PLAYER_SCRIPT = """
+local data = redis.call('HGET', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[1], ARGV[1])
+for i = 2, #KEYS do
+    redis.call('ZREM', KEYS[i], ARGV[1])
+end
+if data and ARGV[2] then
+    for _, interest in ipairs(cjson.decode(data).interests) do
+        redis.call('SREM', ARGV[2] .. interest, ARGV[1])
+    end
+end
+return data
+"""
+
+# KEYS[1] = hash des joueurs, KEYS[2] = index d'arrivée
+POP_CHILL_PAIR_SCRIPT = """
+local hash, join = KEYS[1], KEYS[2]
+while true do
+    local ids = redis.call('ZRANGE', join, 0, 1)
+    if #ids < 2 then
+        return nil
+    end
+    local d1 = redis.call('HGET', hash, ids[1])
+    local d2 = redis.call('HGET', hash, ids[2])
+    if d1 and d2 then
+        redis.call('HDEL', hash, ids[1], ids[2])
+        redis.call('ZREM', join, ids[1], ids[2])
+        return {d1, d2}
+    end
+    -- Entrée d'index orpheline : on la retire et on recommence
+    if not d1 then redis.call('ZREM', join, ids[1]) end
+    if not d2 then redis.call('ZREM', join, ids[2]) end
+end
+"""
+
+# Relâchement des critères selon l'attente : 0 à l'arrivée, 0.5 à la cible p50,
+# 1 à la cible p99 du mode (linéaire par morceaux). Partagé par les scripts.
+RELAXATION_LUA = """
+local function relaxation(wait, p50, p99)
+    if wait <= 0 then
+        return 0
+    elseif wait < p50 then
+        return 0.5 * wait / p50
+    elseif wait < p99 then
+        return 0.5 + 0.5 * (wait - p50) / (p99 - p50)
+    end
+    return 1
+end
+"""
+
+# KEYS[1] = hash, KEYS[2] = index d'arrivée, KEYS[3] = age:male, KEYS[4] = age:female
+# ARGV[1] = maintenant, ARGV[2] = fenêtre d'âge initiale, ARGV[3] = écart d'âge max,
+# ARGV[4] = cible p50, ARGV[5] = cible p99, ARGV[6] = curseur dans l'index
+# d'arrivée, ARGV[7] = taille du scan
+# Retourne {curseur} si aucune paire dans la fenêtre (-1 si la file est épuisée),
+# ou {curseur, chercheur, partenaire} ; le curseur permet de reprendre le parcours.
+POP_DATE_PAIR_SCRIPT = RELAXATION_LUA + """
+local hash, join = KEYS[1], KEYS[2]
+local ages = {male = KEYS[3], female = KEYS[4]}
+local opposite = {male = 'female', female = 'male'}
+local now, initial, max_diff = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local p50, p99 = tonumber(ARGV[4]), tonumber(ARGV[5])
+local cursor, scan = tonumber(ARGV[6]), tonumber(ARGV[7])
+
+local function remove(player)
+    redis.call('HDEL', hash, player)
+    for i = 2, #KEYS do
+        redis.call('ZREM', KEYS[i], player)
+    end
+end
+
+local function nearest(index, age, window)
+    local best, best_diff = nil, nil
+    local older = redis.call('ZRANGEBYSCORE', index, age, age + window, 'WITHSCORES', 'LIMIT', 0, 1)
+    if older[1] then
+        best, best_diff = older[1], tonumber(older[2]) - age
+    end
+    local younger = redis.call('ZREVRANGEBYSCORE', index, age, age - window, 'WITHSCORES', 'LIMIT', 0, 1)
+    if younger[1] and (best == nil or age - tonumber(younger[2]) < best_diff) then
+        best = younger[1]
+    end
+    return best
+end
+
+local seekers = redis.call('ZRANGE', join, cursor, cursor + scan - 1, 'WITHSCORES')
+if #seekers == 0 then
+    return {-1}
+end
+
+-- Tous les joueurs sont servis par ancienneté ; un partenaire trouvé est
+-- forcément plus récent, le curseur reste donc valide après les retraits.
+for i = 1, #seekers, 2 do
+    local seeker = seekers[i]
+    local seeker_raw = redis.call('HGET', hash, seeker)
+    if not seeker_raw then
+        remove(seeker)
+    else
+        local seeker_data = cjson.decode(seeker_raw)
+        local index = ages[opposite[seeker_data.gender] or '']
+        local age = tonumber(seeker_data.age)
+        local window = initial + (max_diff - initial) * relaxation(now - tonumber(seekers[i + 1]), p50, p99)
+        while true do
+            local partner = index and age and nearest(index, age, window)
+            if not partner then
+                cursor = cursor + 1
+                break
+            end
+            local partner_raw = redis.call('HGET', hash, partner)
+            if partner_raw then
+                remove(seeker)
+                remove(partner)
+                return {cursor, seeker_raw, partner_raw}
+            end
+            remove(partner)
+        end
+    end
+end
+return {cursor}
+"""
+
+# KEYS[1] = hash, KEYS[2] = index d'arrivée
+# ARGV[1] = préfixe de l'index inversé, ARGV[2] = maintenant, ARGV[3] = seuil de
+# Jaccard initial, ARGV[4] = seuil plancher, ARGV[5] = cible p50, ARGV[6] = cible
+# p99, ARGV[7] = curseur, ARGV[8] = taille du scan, ARGV[9] = candidats examinés
+# au plus par chercheur, ARGV[10] = candidats examinés au plus par appel
+# Les clés de l'index inversé sont dérivées du préfixe dans le script (Redis
+# non cluster). Retour identique à POP_DATE_PAIR_SCRIPT ; l'appel s'arrête
+# aussi quand le budget de candidats est épuisé, le curseur permet de reprendre.
+POP_INTERESTS_PAIR_SCRIPT = RELAXATION_LUA + """
+local hash, join, prefix = KEYS[1], KEYS[2], ARGV[1]
+local now, base, floor = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local p50, p99 = tonumber(ARGV[5]), tonumber(ARGV[6])
+local cursor, scan = tonumber(ARGV[7]), tonumber(ARGV[8])
+local limit, budget = tonumber(ARGV[9]), tonumber(ARGV[10])
+
+local function remove(player, data)
+    redis.call('HDEL', hash, player)
+    redis.call('ZREM', join, player)
+    for _, interest in ipairs(data.interests) do
+        redis.call('SREM', prefix .. interest, player)
+    end
+end
+
+local seekers = redis.call('ZRANGE', join, cursor, cursor + scan - 1, 'WITHSCORES')
+if #seekers == 0 then
+    return {-1}
+end
+
+local examined = 0
+for i = 1, #seekers, 2 do
+    -- Redis est bloqué pendant le script : au-delà du budget on rend la main
+    if examined >= budget then
+        return {cursor}
+    end
+    local seeker = seekers[i]
+    local seeker_raw = redis.call('HGET', hash, seeker)
+    if not seeker_raw then
+        redis.call('ZREM', join, seeker)
+    else
+        local seeker_data = cjson.decode(seeker_raw)
+        local mine = {}
+        local sizes = {}
+        for _, interest in ipairs(seeker_data.interests) do
+            mine[interest] = true
+            sizes[#sizes + 1] = {interest, redis.call('SCARD', prefix .. interest)}
+        end
+        -- Au plus `limit` candidats partageant un intérêt, tirés au hasard en
+        -- commençant par les intérêts les plus rares (les plus discriminants) :
+        -- un intérêt partagé par toute la file ne la fait pas parcourir en entier
+        table.sort(sizes, function(a, b) return a[2] < b[2] end)
+        local candidates, count = {}, 0
+        for _, entry in ipairs(sizes) do
+            if count >= limit then
+                break
+            end
+            for _, other in ipairs(redis.call('SRANDMEMBER', prefix .. entry[1], limit - count + 1)) do
+                if other ~= seeker and not candidates[other] and count < limit then
+                    candidates[other] = true
+                    count = count + 1
+                end
+            end
+        end
+        examined = examined + count
+
+        -- Le seuil baisse avec l'attente du plus ancien des deux (le chercheur)
+        local threshold = base - (base - floor) * relaxation(now - tonumber(seekers[i + 1]), p50, p99)
+        local best, best_raw, best_score, best_join = nil, nil, -1, nil
+        for other in pairs(candidates) do
+            local other_raw = redis.call('HGET', hash, other)
+            if other_raw then
+                local other_data = cjson.decode(other_raw)
+                local shared = 0
+                for _, interest in ipairs(other_data.interests) do
+                    if mine[interest] then
+                        shared = shared + 1
+                    end
+                end
+                local score = shared / (#seeker_data.interests + #other_data.interests - shared)
+                if score >= threshold and (score > best_score or (score == best_score and other_data.join_time < best_join)) then
+                    best, best_raw, best_score, best_join = other, other_raw, score, other_data.join_time
+                end
+            end
+        end
+
+        if best then
+            remove(seeker, seeker_data)
+            remove(best, cjson.decode(best_raw))
+            return {cursor, seeker_raw, best_raw}
+        end
+        cursor = cursor + 1
+    end
+end
+return {cursor}
+"""
 
 class MatchMaker():
     MAX_AGE_DIFFERENCE = 100
+    GENDERS = ("male", "female")
+    SCAN_BATCH = 100 # nombre de joueurs examinés par appel du script
+    SCAN_LIMIT = SCAN_LIMIT # joueurs examinés au plus par tick et par mode
+
+    def __init__(self, redis=None):
+        # `redis` permet d'injecter un autre client (simulateur, fakeredis)
+        self.redis = redis or InstrumentedRedis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD, decode_responses=True)
+        self.keys = {
+            "chill": REDIS_MATCHMAKER_KEY + ":waiting_players:chill",
+            "date": REDIS_MATCHMAKER_KEY + ":waiting_players:date",
+            "interests": REDIS_MATCHMAKER_KEY + ":waiting_players:interests",
+        }
+        self.scripts = {
+            "take_player": TAKE_PLAYER_SCRIPT,
+            "pop_chill_pair": POP_CHILL_PAIR_SCRIPT,
+            "pop_date_pair": POP_DATE_PAIR_SCRIPT,
+            "pop_interests_pair": POP_INTERESTS_PAIR_SCRIPT,
+        }
+        self._take_player = self.redis.register_script(TAKE_PLAYER_SCRIPT)
+        self._pop_chill_pair = self.redis.register_script(POP_CHILL_PAIR_SCRIPT)
+        self._pop_date_pair = self.redis.register_script(POP_DATE_PAIR_SCRIPT)
+        self._pop_interests_pair = self.redis.register_script(POP_INTERESTS_PAIR_SCRIPT)
+        # Cibles de temps d'attente par mode : les critères se relâchent le
+        # long de RELAXATION_LUA pour les tenir ; le temps réellement observé
+        # est suivi par metrics.TIME_TO_MATCH (matchmaking_loop)
+        self.targets = TARGETS
+
+        # Réveil de la boucle de matchmaking : Event local + pub/sub entre process
+        self.wakeup = asyncio.Event()
+        self.wakeup_channel = REDIS_MATCHMAKER_KEY + ":wakeup"
+        self.instance_id = uuid.uuid4().hex
+
+    async def load_scripts(self):
+        # Précharge les scripts au démarrage ; ensuite seul EVALSHA circule
+        for script in self.scripts.values():
+            await self.redis.script_load(script)
+
+    def join_index(self, mode:str):
+        # ZSET username -> join_time : la file de priorité par ancienneté
+        return f"{self.keys[mode]}:join"
+
+    def age_index(self, mode:str, gender:str):
+        # ZSET username -> age, un par genre
+        return f"{self.keys[mode]}:age:{gender}"
 
-    def __init__(self):
-        self.redis = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD, decode_responses=True)
-        self.keys = {"chill": REDIS_MATCHMAKER_KEY + ":waiting_players:chill", "date": REDIS_MATCHMAKER_KEY + ":waiting_players:date"}
+    def interest_prefix(self, mode:str):
+        # SET username par intérêt : {prefix}{intérêt}
+        return f"{self.keys[mode]}:interest:"
 
-    async def add_player(self, player:str, gender:str, age:int, interests:list, mode:Literal["chill", "date"]):
+    @staticmethod
+    def normalize_interests(interests:list):
+        return sorted({str(interest).strip().lower() for interest in interests if str(interest).strip()})
+
+    def _take_args(self, player:str, mode:str):
+        if mode == "interests":
+            return [player, self.interest_prefix(mode)]
+        return [player]
+
+    def index_keys(self, mode:str):
+        if mode == "date":
+            return [self.join_index(mode), *(self.age_index(mode, gender) for gender in self.GENDERS)]
+        return [self.join_index(mode)]
+
+    async def queue_depths(self) -> dict:
+        """Nombre de joueurs en attente par mode, en un aller-retour."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in self.keys.values():
+                pipe.hlen(key)
+            depths = await pipe.execute()
+        return dict(zip(self.keys, depths))
+
+    async def listen_wakeups(self):
+        """Relaie en local les réveils publiés par les autres process."""
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.wakeup_channel)
+                    async for message in pubsub.listen():
+                        # Nos propres publications ont déjà réveillé la boucle locale
+                        if not message["data"].startswith(self.instance_id):
+                            self.wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("matchmaking wakeup listener crashed")
+                await asyncio.sleep(1)
+
+    async def wait_for_players(self, timeout:float):
+        """Attend un nouvel arrivant (ou le timer de secours) avant le prochain tick."""
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    async def add_player(self, player:str, gender:str, age:int, interests:list, mode:Literal["chill", "date", "interests"], remove_from=(), join_time:float|None=None):
+        """
+        Ajoute player à la file `mode` après l'avoir retiré des files `remove_from`, en une transaction.
+        `join_time` : entrée initiale dans la file, pour un joueur remis en file
+        (il garde sa place et l'assouplissement déjà acquis des critères).
+        """
         player_data = {
             "username": player,
             "gender": gender,
             "age": age,
             "interests": interests,
-            "join_time": time.time()
+            "join_time": join_time or time.time()
         }
-        await self.redis.hset(self.keys[mode], player, json.dumps(player_data))
+        remove_from = [other for other in remove_from if other != mode]
+        if mode == "interests":
+            player_data["interests"] = self.normalize_interests(interests)
+            # Ses anciens intérêts ne sont connus que du hash : on retire d'abord le joueur
+            remove_from.append(mode)
 
-    async def remove_player(self, player, mode:Literal["chill", "date"], ignore_error=False):
         try:
-            await self.redis.hdel(self.keys[mode], player)
+            await self._add_player(player, player_data, mode, remove_from)
+        except NoScriptError:
+            # Scripts perdus côté Redis (redémarrage, SCRIPT FLUSH) : les
+            # autres commandes de la transaction sont passées, mais la
+            # transaction entière est idempotente et peut être rejouée
+            logger.warning("matchmaking scripts missing, reloading")
+            await self.load_scripts()
+            await self._add_player(player, player_data, mode, remove_from)
+        self.wakeup.set()
+
+    async def _add_player(self, player:str, player_data:dict, mode:str, remove_from:list):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await self.queue_remove(pipe, player, remove_from)
+            # Un joueur ré-ajouté ne doit pas garder d'anciennes entrées d'index
+            for key in self.index_keys(mode):
+                pipe.zrem(key, player)
+            pipe.hset(self.keys[mode], player, json.dumps(player_data))
+            pipe.zadd(self.join_index(mode), {player: player_data["join_time"]})
+            if mode == "date" and player_data["gender"] in self.GENDERS:
+                pipe.zadd(self.age_index(mode, player_data["gender"]), {player: player_data["age"]})
+            if mode == "interests":
+                for interest in player_data["interests"]:
+                    pipe.sadd(self.interest_prefix(mode) + interest, player)
+            pipe.publish(self.wakeup_channel, f"{self.instance_id}:{mode}")
+            await pipe.execute()
+
+    async def queue_remove(self, pipe, player:str, modes):
+        """
+        Ajoute au pipeline le retrait de player des files `modes` (sans
+        aller-retour). EVALSHA brut : le script est préchargé par
+        load_scripts, alors qu'un Script passé au pipeline lui ferait envoyer
+        un SCRIPT EXISTS de plus. En cas de NoScriptError, recharger et rejouer.
+        """
+        for mode in modes:
+            keys = [self.keys[mode], *self.index_keys(mode)]
+            pipe.evalsha(self._take_player.sha, len(keys), *keys, *self._take_args(player, mode))
+
+    async def remove_player(self, player, mode:Literal["chill", "date", "interests"], ignore_error=False):
+        try:
+            await self._take_player(keys=[self.keys[mode], *self.index_keys(mode)], args=self._take_args(player, mode))
         except Exception as e:
             if not ignore_error:
                 raise e
 
-    async def get_player(self, player:str, mode:Literal["chill", "date"], remove:bool=False):
-        # Cette fonction est moins utilisée maintenant mais on la garde pour le mode chill
-        player_data = await self.redis.hget(self.keys[mode], player)
+    async def get_player(self, player:str, mode:Literal["chill", "date", "interests"], remove:bool=False):
+        if remove:
+            # HGET + HDEL atomiques : un seul worker peut réclamer ce joueur
+            player_data = await self._take_player(keys=[self.keys[mode], *self.index_keys(mode)], args=self._take_args(player, mode))
+        else:
+            player_data = await self.redis.hget(self.keys[mode], player)
         if player_data:
             try:
-                data = json.loads(player_data)
+                return json.loads(player_data)
             except json.JSONDecodeError:
                 raise ValueError("Invalid player data")
-            if remove:
-                await self.remove_player(player, mode)
-            return data
         else:
             raise KeyError(f"Player {player} does not exist")
 
-    
-    async def find_match(self, mode:Literal["chill", "date"]):
-        if mode == "chill":
-            waiting_players = await self.redis.hkeys(self.keys[mode])
-            if len(waiting_players) >= 2:
-                player1 = await self.get_player(waiting_players[0], remove=True, mode=mode)
-                player2 = await self.get_player(waiting_players[1], remove=True, mode=mode)
-                return (player1, player2)
-            return None
+    async def find_match(self, mode:Literal["chill", "date", "interests"]):
+        matches = await self.find_matches(mode, limit=1)
+        return matches[0] if matches else None
 
+    async def find_matches(self, mode:Literal["chill", "date", "interests"], limit:int=100):
+        """Forme en une passe jusqu'à `limit` paires disjointes pour ce mode."""
+        if mode == "chill":
+            return await self._find_chill_matches(mode, limit)
         if mode == "date":
-            all_players_data = await self.redis.hgetall(self.keys[mode])
-            if len(all_players_data) < 2:
-                return None
-
-            # 1. Séparer les joueurs par genre
-            men = []
-            women = []
-            for username, data_str in all_players_data.items():
-                try:
-                    player = json.loads(data_str)
-                    if player.get("gender") == "male":
-                        men.append(player)
-                    elif player.get("gender") == "female":
-                        women.append(player)
-                except (json.JSONDecodeError, TypeError):
-                    continue
-            
-            # S'il n'y a pas au moins un homme et une femme, impossible de matcher
-            if not men or not women:
-                return None
-
-            # 2. Trier le groupe prioritaire (femmes) par temps d'attente
-            women.sort(key=lambda p: p.get("join_time", float('inf')))
-
-            i = 0
-            # 3. Itérer sur chaque femme (chercheuse) pour lui trouver le meilleur partenaire
-            for woman in women:
-                best_partner_for_her = None
-                min_age_diff = float('inf')
-
-                # On cherche le meilleur partenaire pour cette femme spécifique
-                for man in men:
-                    age_diff = abs(woman.get("age", 99) - man.get("age", 99))
-                    if i % 10 == 0:
-                        await asyncio.sleep(0) #let the loop keep the control
-                    i+=1
-                    if age_diff < min_age_diff:
-                        min_age_diff = age_diff
-                        best_partner_for_her = man
-                
-                # 4. Si un partenaire a été trouvé ET qu'il respecte le seuil
-                if best_partner_for_her and min_age_diff <= self.MAX_AGE_DIFFERENCE:
-                    # Match trouvé !
-                    await self.remove_player(woman["username"], mode)
-                    await self.remove_player(best_partner_for_her["username"], mode)
-                    
-                    # On retourne le match et on arrête la recherche pour ce cycle
-                    return (woman, best_partner_for_her)
-
-            # Si on a parcouru toutes les femmes sans trouver de match valide
+            return await self._find_date_matches(mode, limit)
+        if mode == "interests":
+            return await self._find_interests_matches(mode, limit)
+        return []
+
+    @staticmethod
+    def _decode_pair(pair):
+        try:
+            return (json.loads(pair[0]), json.loads(pair[1]))
+        except (json.JSONDecodeError, TypeError):
             return None
-        
-        return None
\ No newline at end of file
+
+    async def _find_chill_matches(self, mode:str, limit:int):
+        matches = []
+        while len(matches) < limit:
+            pair = await self._pop_chill_pair(keys=[self.keys[mode], self.join_index(mode)])
+            if not pair:
+                break
+            decoded = self._decode_pair(pair)
+            if decoded:
+                matches.append(decoded)
+        return matches
+
+    async def _scan_matches(self, script, keys:list, args, limit:int):
+        # Parcourt la file par ancienneté, SCAN_BATCH joueurs par appel et au
+        # plus SCAN_LIMIT par tick : la file n'est jamais relue en entier.
+        # `args(cursor)` construit les arguments du script pour ce curseur.
+        matches = []
+        cursor = 0
+        while len(matches) < limit and cursor < self.SCAN_LIMIT:
+            result = await script(keys=keys, args=args(cursor))
+            cursor = int(result[0])
+            if len(result) == 3:
+                decoded = self._decode_pair(result[1:])
+                if decoded:
+                    matches.append(decoded)
+            if cursor < 0:
+                break
+            await asyncio.sleep(0) # let the loop keep the control
+        return matches
+
+    async def _find_date_matches(self, mode:str, limit:int):
+        # Partenaire de genre opposé le plus proche en âge, dans une fenêtre qui
+        # s'élargit avec l'attente jusqu'à MAX_AGE_DIFFERENCE.
+        keys = [self.keys[mode], self.join_index(mode), self.age_index(mode, "male"), self.age_index(mode, "female")]
+        now = time.time()
+        targets = self.targets[mode]
+        return await self._scan_matches(self._pop_date_pair, keys, lambda cursor: [
+            now, DATE_CONFIG["initial_age_window"], self.MAX_AGE_DIFFERENCE,
+            targets["p50"], targets["p99"], cursor, self.SCAN_BATCH,
+        ], limit)
+
+    async def _find_interests_matches(self, mode:str, limit:int):
+        # Partenaire à la meilleure similarité de Jaccard parmi un échantillon
+        # borné de ceux qui partagent au moins un intérêt ; le seuil baisse
+        # avec l'attente.
+        keys = [self.keys[mode], self.join_index(mode)]
+        now = time.time()
+        targets = self.targets[mode]
+        return await self._scan_matches(self._pop_interests_pair, keys, lambda cursor: [
+            self.interest_prefix(mode), now,
+            INTERESTS_CONFIG["base_threshold"], INTERESTS_CONFIG["min_threshold"],
+            targets["p50"], targets["p99"], cursor, self.SCAN_BATCH,
+            INTERESTS_CONFIG["max_candidates"], INTERESTS_CONFIG["max_candidates_per_call"],
+        ], limit)
@@ -0,0 +1,147 @@
+import asyncio
+import bisect
+import inspect
+import time
+import redis.asyncio as aioredis
+
+# Métriques au format texte Prometheus, sans dépendance. Une mise à jour coûte
+# un accès dict (et une bisection pour les histogrammes) : elles restent
+# activées en production. Les gauges coûteuses sont calculées au scrape.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+WAIT_BUCKETS = (0.5, 1, 2, 5, 10, 15, 30, 60, 90, 120, 300, 600)
+
+registry = []
+
+
+def _format_labels(labelnames: tuple, labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric():
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        registry.append(self)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    async def render(self) -> list:
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in self.values.items()]
+
+
+class Gauge(Metric):
+    """Gauge affectée directement, ou calculée au scrape par `collect`
+    (nombre ou {labels: valeur}, éventuellement coroutine)."""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), collect=None):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.collect = collect
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    async def render(self) -> list:
+        values = self.values
+        if self.collect:
+            collected = self.collect()
+            if inspect.isawaitable(collected):
+                collected = await collected
+            values = collected if isinstance(collected, dict) else {(): collected}
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        self.values = {} # labels -> [compteurs par bucket (+Inf en dernier), somme, total]
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    async def render(self) -> list:
+        lines = self.header()
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+async def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(await metric.render())
+    return "\n".join(lines) + "\n"
+
+
+MATCHES = Counter("wisp_matches_total", "Matches formed", ("mode",))
+TIME_TO_MATCH = Histogram("wisp_time_to_match_seconds", "Time spent in the matchmaking queue before a match", ("mode",), WAIT_BUCKETS)
+MESSAGES_RELAYED = Counter("wisp_messages_relayed_total", "Chat messages relayed to a room")
+FRAMES_REJECTED = Counter("wisp_frames_rejected_total", "Client frames rejected by the ingestion limits", ("reason",))
+REDIS_LATENCY = Histogram("wisp_redis_latency_seconds", "Redis round-trip latency", ("command",))
+LOOP_LAG = Histogram("wisp_event_loop_lag_seconds", "Delay of a periodic timer, i.e. time the event loop was blocked")
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Client Redis qui mesure chaque aller-retour (commandes, scripts, pipelines)."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(time.perf_counter() - start, str(args[0]).upper())
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def timed_execute(raise_on_error: bool = True):
+            start = time.perf_counter()
+            try:
+                return await execute(raise_on_error)
+            finally:
+                REDIS_LATENCY.observe(time.perf_counter() - start, "MULTI" if transaction else "PIPELINE")
+
+        pipe.execute = timed_execute
+        return pipe
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
@@ -0,0 +1,48 @@
+import uuid
+from enum import StrEnum
+
+# Représentation compacte de l'état par connexion. Les enums sont des str :
+# elles se comparent, se hashent et se sérialisent comme leur valeur, mais un
+# profil ne garde qu'une référence vers un singleton au lieu de sa propre copie
+# de "female" ou "interests" issue du JSON.
+
+
+class Gender(StrEnum):
+    MALE = "male"
+    FEMALE = "female"
+
+
+class Mode(StrEnum):
+    CHILL = "chill"
+    DATE = "date"
+    INTERESTS = "interests"
+
+
+def room_key(name: str):
+    """
+    Clé interne d'une room : les 16 octets de l'UUID pour un UUID canonique
+    (les rooms créées par le matchmaking), le nom tel quel sinon.
+    """
+    try:
+        key = uuid.UUID(name)
+    except (ValueError, TypeError, AttributeError):
+        return name
+    # Seule la forme canonique est compactée : "{...}" ou les majuscules
+    # resteraient sinon des rooms distinctes
+    return key.bytes if str(key) == name else name
+
+
+def room_name(key) -> str:
+    return str(uuid.UUID(bytes=key)) if isinstance(key, bytes) else key
+
+
+class RoomMembers(set):
+    """Usernames locaux d'une room. `key` est l'instance de clé partagée par
+    le dict des rooms et le my_rooms de chaque membre ; `bucket` le seau de
+    limitation des messages de la room."""
+    __slots__ = ("key", "bucket")
+
+    def __init__(self, key, bucket=None):
+        super().__init__()
+        self.key = key
+        self.bucket = bucket
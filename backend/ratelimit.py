@@ -0,0 +1,37 @@
+import time
+
+
+class TokenBucket():
+    """État d'un seau : deux floats, créé par connexion et par room."""
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter():
+    """
+    Limite en seau à jetons : `rate` frames par seconde en régime établi, des
+    rafales jusqu'à `burst`. Les paramètres sont partagés, seuls les seaux
+    sont par connexion ou par room ; le remplissage est calculé à la demande
+    (pas de timer), un test coûte quelques opérations flottantes.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    def bucket(self) -> TokenBucket:
+        return TokenBucket(self.burst, time.monotonic())
+
+    def allow(self, bucket: TokenBucket, now: float | None = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if tokens >= 1:
+            bucket.tokens = tokens - 1
+            return True
+        bucket.tokens = tokens
+        return False
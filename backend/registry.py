@@ -0,0 +1,50 @@
+import asyncio
+import zlib
+
+
+class ConnectionRegistry():
+    """
+    Registre des connexions locales {username: User}.
+
+    Les lectures sont sans verrou (une boucle asyncio ne s'interrompt qu'aux
+    await). Les transitions d'un même username (connexion, reconnexion,
+    déconnexion) prennent le verrou de son shard ; aucune I/O réseau ne doit
+    être faite pendant qu'il est tenu.
+    """
+
+    def __init__(self, shards: int = 64):
+        self._users = {}
+        self._locks = [asyncio.Lock() for _ in range(shards)]
+
+    def lock(self, username: str) -> asyncio.Lock:
+        # crc32 plutôt que hash() : stable d'un process à l'autre
+        return self._locks[zlib.crc32(username.encode()) % len(self._locks)]
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._users
+
+    def __getitem__(self, username: str):
+        return self._users[username]
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __iter__(self):
+        return iter(list(self._users))
+
+    def values(self):
+        return list(self._users.values())
+
+    def get(self, username: str, default=None):
+        return self._users.get(username, default)
+
+    def add(self, username: str, user):
+        self._users[username] = user
+
+    def discard(self, username: str, user=None) -> bool:
+        """Retire username, seulement s'il pointe encore vers `user` quand il est fourni."""
+        current = self._users.get(username)
+        if current is None or (user is not None and current is not user):
+            return False
+        del self._users[username]
+        return True
@@ -0,0 +1,146 @@
+import json
+import time
+from collections import OrderedDict
+
+# Données de profil d'un utilisateur non connecté : saisies par /setup/* avant
+# l'ouverture de /ws, ou conservées après une déconnexion pour permettre une
+# reconnexion. Une seule entrée par username, consommée par la connexion /ws.
+#   {"age": int, "gender": str, "interests": list, "mode": str (optionnel)}
+
+# Met à jour une session seulement si elle existe encore (pas de résurrection
+# d'une session expirée). KEYS[1] = hash ; ARGV[1] = ttl, ARGV[2..] = champ, valeur...
+UPDATE_SESSION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class MemorySessionStore():
+    """
+    Sessions dans le process, bornées en nombre (LRU) et en durée (TTL).
+    Chaque entrée est un tuple (expiration, age, gender, interests, mode)
+    plutôt qu'un dict : un flood d'inscriptions coûte peu de mémoire.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def set(self, username: str, data: dict, ttl: float | None = None):
+        self._sessions[username] = (time.monotonic() + (ttl or self.ttl), data["age"], data["gender"], tuple(data["interests"]), data.get("mode"))
+        self._sessions.move_to_end(username)
+        self._evict()
+
+    async def queue_set(self, pipe, username: str, data: dict, ttl: float | None = None):
+        # Rien à envoyer à Redis : appliqué tout de suite
+        await self.set(username, data, ttl)
+
+    async def get(self, username: str) -> dict | None:
+        entry = self._live(username)
+        return self._to_dict(entry) if entry else None
+
+    async def pop(self, username: str) -> dict | None:
+        entry = self._live(username)
+        if entry is None:
+            return None
+        del self._sessions[username]
+        return self._to_dict(entry)
+
+    async def update(self, username: str, **fields) -> bool:
+        session = await self.get(username)
+        if session is None:
+            return False
+        session.update(fields)
+        await self.set(username, session)
+        return True
+
+    def _live(self, username: str):
+        entry = self._sessions.get(username)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._sessions[username]
+            return None
+        return entry
+
+    def _evict(self):
+        # Les plus anciennes écritures en tête : on retire celles qui ont expiré
+        # puis, au-delà de max_size, les moins récemment écrites
+        now = time.monotonic()
+        while self._sessions:
+            username, entry = next(iter(self._sessions.items()))
+            if entry[0] > now and len(self._sessions) <= self.max_size:
+                break
+            del self._sessions[username]
+
+    @staticmethod
+    def _to_dict(entry) -> dict:
+        _, age, gender, interests, mode = entry
+        data = {"age": age, "gender": gender, "interests": list(interests)}
+        if mode is not None:
+            data["mode"] = mode
+        return data
+
+
+class RedisSessionStore():
+    """Sessions en hash Redis `{prefix}:{username}` avec expiration : partagées entre workers."""
+
+    def __init__(self, redis, prefix: str, ttl: int):
+        self.redis = redis
+        self.prefix = prefix
+        self.ttl = ttl
+        self._update = redis.register_script(UPDATE_SESSION_SCRIPT)
+
+    def key(self, username: str) -> str:
+        return f"{self.prefix}:{username}"
+
+    async def set(self, username: str, data: dict, ttl: int | None = None):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await self.queue_set(pipe, username, data, ttl)
+            await pipe.execute()
+
+    async def queue_set(self, pipe, username: str, data: dict, ttl: int | None = None):
+        """Ajoute l'écriture de la session à un pipeline, sans aller-retour."""
+        key = self.key(username)
+        pipe.delete(key)
+        pipe.hset(key, mapping=self._encode(data))
+        pipe.expire(key, int(ttl or self.ttl))
+
+    async def get(self, username: str) -> dict | None:
+        return self._decode(await self.redis.hgetall(self.key(username)))
+
+    async def pop(self, username: str) -> dict | None:
+        key = self.key(username)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(key)
+            pipe.delete(key)
+            data, _ = await pipe.execute()
+        return self._decode(data)
+
+    async def update(self, username: str, **fields) -> bool:
+        args = [self.ttl]
+        for field, value in self._encode(fields).items():
+            args += [field, value]
+        return bool(await self._update(keys=[self.key(username)], args=args))
+
+    @staticmethod
+    def _encode(data: dict) -> dict:
+        encoded = {field: value for field, value in data.items() if value is not None}
+        if "interests" in encoded:
+            encoded["interests"] = json.dumps(list(encoded["interests"]))
+        return encoded
+
+    @staticmethod
+    def _decode(data: dict) -> dict | None:
+        if not data:
+            return None
+        session = {"age": int(data["age"]), "gender": data["gender"], "interests": json.loads(data["interests"])}
+        if "mode" in data:
+            session["mode"] = data["mode"]
+        return session
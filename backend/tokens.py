@@ -0,0 +1,114 @@
+import hashlib
+import heapq
+import math
+import time
+from collections import OrderedDict
+import jwt
+
+
+class TokenVerifier():
+    """
+    Vérification des JWT avec un cache LRU borné
+    {token: [username, exp, id de révocation, revérifié jusqu'à]}.
+
+    Seuls les tokens valides sont mis en cache ; une entrée expire avec son
+    token. Les tokens révoqués (/token/logout) restent dans un petit ensemble
+    jusqu'à leur expiration naturelle, après quoi jwt.decode les refuse seul.
+
+    Avec `redis` (plusieurs workers), une révocation est aussi écrite dans
+    Redis (`{prefix}:{jti}`, expirant avec le token) et `check` la consulte,
+    au plus une fois par `recheck` secondes et par token : un token révoqué
+    sur un autre worker est refusé ici au plus `recheck` secondes plus tard.
+    L'ensemble local sert de cache des révocations déjà vues.
+    """
+
+    def __init__(self, secret_key: str, algorithm: str, cache_size: int = 10000,
+                 redis=None, prefix: str = "revoked", recheck: float = 1.0):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self.redis = redis
+        self.prefix = prefix
+        self.recheck = recheck
+        self._cache = OrderedDict()
+        self._revoked = set()
+        self._revoked_expiry = [] # tas (exp, token) pour purger les révocations périmées
+
+    def revoked_key(self, revocation_id: str) -> str:
+        return f"{self.prefix}:{revocation_id}"
+
+    def decode(self, token: str):
+        """Vérification HMAC complète, sans cache : entrée de cache ou None."""
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError: # ExpiredSignatureError comprise
+            return None
+        username = payload.get("sub")
+        if username is None:
+            return None
+        # Les tokens émis sans jti sont révoqués sous l'empreinte du token
+        revocation_id = payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+        return [username, payload.get("exp", float("inf")), revocation_id, 0.0]
+
+    def verify(self, token: str):
+        """Vérification locale seulement (signature, expiration, révocations vues ici)."""
+        entry = self._lookup(token)
+        return entry[0] if entry else None
+
+    async def check(self, token: str):
+        """verify, plus les révocations faites par les autres workers (Redis)."""
+        entry = self._lookup(token)
+        if entry is None or self.redis is None:
+            return entry[0] if entry else None
+        now = time.monotonic()
+        if entry[3] > now:
+            return entry[0]
+        if await self.redis.exists(self.revoked_key(entry[2])):
+            self._revoke_local(token, entry)
+            return None
+        entry[3] = now + self.recheck
+        return entry[0]
+
+    async def revoke(self, token: str):
+        entry = self._cache.get(token) or self.decode(token)
+        if entry is None:
+            return
+        self._revoke_local(token, entry)
+        if self.redis is not None:
+            ttl = entry[1] - time.time()
+            if ttl > 0:
+                await self.redis.set(self.revoked_key(entry[2]), 1, ex=None if math.isinf(ttl) else math.ceil(ttl))
+
+    def _lookup(self, token: str):
+        if not token or token in self._revoked:
+            return None
+        now = time.time()
+        entry = self._cache.get(token)
+        if entry is not None:
+            if entry[1] > now:
+                self._cache.move_to_end(token)
+                return entry
+            del self._cache[token]
+            return None
+
+        entry = self.decode(token)
+        if entry is None:
+            return None
+        self._cache[token] = entry
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return entry
+
+    def _revoke_local(self, token: str, entry):
+        self._cache.pop(token, None)
+        if token in self._revoked:
+            return
+        self._revoked.add(token)
+        heapq.heappush(self._revoked_expiry, (entry[1], token))
+        self._purge_revoked()
+
+    def _purge_revoked(self):
+        now = time.time()
+        while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+            _, token = heapq.heappop(self._revoked_expiry)
+            self._revoked.discard(token)
@@ -8,6 +8,7 @@ const ws = ref(null)
 const myRooms = ref([])
 const messages = ref([])
 const events = ref([])
+const lastSeq = {}  // room -> seq of the last message received, sent back on rejoin to catch up
 const match = ref({"matched": "waiting", "opponent": {"username": null, "gender": null}})  //"waiting", "matched",  "stable"
 
 let store
@@ -50,11 +51,20 @@ function initWebSocket(onOpenCallback=null) {
                 const json = JSON.parse(event.data)
                 if (json.action == "receive_message") {
                     messages.value.push({"from_user": json.content.from_user, "content": json.content.message})
+                    if (json.content.seq != null) lastSeq[json.content.from_room] = json.content.seq
+                } else if (json.action == "history") {
+                    for (const missed of json.content.messages) {
+                        messages.value.push({"from_user": missed.from_user, "content": missed.message})
+                        lastSeq[missed.from_room] = missed.seq
+                    }
                 } else if (json.action == "login") {
                     console.log("Logged in")
                     events.value.push({"login": json.content})
                 } else if (json.action == "matched") {
                     whenMatched(json.content.room, json.content.user)
+                } else if (json.action == "ping") {
+                    // heartbeat: the server closes connections that stop answering
+                    sendJSON({"action": "pong"})
                 } else if (json.action == "user_left") {
                     console.log(`${json.content.username} left the room`)
                     match.value.matched = "waiting"
@@ -81,13 +91,10 @@ function reconnect() {
     if (!store.loggedIn){ console.log("Logged out, do not reconnect"); return}
     if (token && username) {
         store.login(username, token)
-        initWebSocket()
+        initWebSocket(rejoinRooms)
         setTimeout(() => {
             myRooms.value = JSON.parse(localStorage.getItem("rooms"))
         }, 1000)
-        for (const room of store.rooms) {
-            joinRoom(room)
-        }
         console.log("Reconnected")
     } else {
         console.error("Token or username not found in localStorage")
@@ -108,6 +115,15 @@ function joinRoom(room) {
     }
 }
 
+// after a reconnect: join again and get the messages missed in the meantime
+function rejoinRooms() {
+    for (const room of store.rooms) {
+        const payload = {"action": "join", "room": room}
+        if (lastSeq[room] != null) payload.since = lastSeq[room]
+        sendJSON(payload)
+    }
+}
+
 function leaveRoom(room) {
     if (!myRooms.value.includes(room)) return
 